@@ -1,54 +1,77 @@
 import asyncio
 import sys
-import json
 import http
 import websockets as Server
 from src.logger import logger
-from src.recv_handler.message_handler import message_handler
-from src.recv_handler.meta_event_handler import meta_event_handler
-from src.recv_handler.notice_handler import notice_handler
+from src import codec
+from src.recv_handler.notice_outbox import notice_outbox
 from src.recv_handler.message_sending import message_send_instance
-from src.send_handler.nc_sending import nc_message_sender
+from src.connection_registry import BotContext, connection_registry
 from src.config import global_config
 from src.mmc_com_layer import mmc_start_com, mmc_stop_com, router
 from src.response_pool import put_response, check_timeout_response
-
-message_queue = asyncio.Queue()
+from src.napcat_client import napcat_client
+from src.ingest_queue import ingest_queue
+from src.media_downloader import media_downloader
+from src.database import async_db_manager
+from src.metrics_report import report_metrics
 
 
 async def message_recv(server_connection: Server.ServerConnection):
-    await message_handler.set_server_connection(server_connection)
-    asyncio.create_task(notice_handler.set_server_connection(server_connection))
-    await nc_message_sender.set_server_connection(server_connection)
-    async for raw_message in server_connection:
-        logger.debug(f"{raw_message[:1500]}..." if (len(raw_message) > 1500) else raw_message)
-        decoded_raw_message: dict = json.loads(raw_message)
-        post_type = decoded_raw_message.get("post_type")
-        if post_type in ["meta_event", "message", "notice"]:
-            await message_queue.put(decoded_raw_message)
-        elif post_type is None:
-            await put_response(decoded_raw_message)
+    context: BotContext = None
+    if self_id := connection_registry.self_id_from_request(server_connection):
+        context = await connection_registry.attach(self_id, server_connection)
+    try:
+        async for raw_message in server_connection:
+            logger.debug(f"{raw_message[:1500]}..." if (len(raw_message) > 1500) else raw_message)
+            decoded_raw_message: dict = codec.loads(raw_message)
+            post_type = decoded_raw_message.get("post_type")
+            if context is None and (self_id := decoded_raw_message.get("self_id")):
+                # 未携带X-Self-ID请求头时，以收到的第一个事件确定账号
+                context = await connection_registry.attach(self_id, server_connection)
+            if post_type in ["meta_event", "message", "notice"]:
+                ingest_queue.put(decoded_raw_message)
+            elif post_type is None:
+                await put_response(decoded_raw_message)
+    finally:
+        connection_registry.detach(context, server_connection)
+
+
+async def message_process(message: dict):
+    context = connection_registry.get(message.get("self_id"))
+    if context is None:
+        logger.warning(f"收到未注册账号的事件，self_id: {message.get('self_id')}")
+        return
+    with napcat_client.deadline():  # 处理该事件时的所有Napcat请求共享同一个时间预算
+        await dispatch_event(context, message)
 
 
-async def message_process():
-    while True:
-        message = await message_queue.get()
-        post_type = message.get("post_type")
-        if post_type == "message":
-            await message_handler.handle_raw_message(message)
-        elif post_type == "meta_event":
-            await meta_event_handler.handle_meta_event(message)
-        elif post_type == "notice":
-            await notice_handler.handle_notice(message)
-        else:
-            logger.warning(f"未知的post_type: {post_type}")
-        message_queue.task_done()
-        await asyncio.sleep(0.05)
+async def dispatch_event(context: BotContext, message: dict):
+    post_type = message.get("post_type")
+    if post_type == "message":
+        connection_registry.remember_route(message)
+        await context.message_handler.handle_raw_message(message)
+    elif post_type == "meta_event":
+        await context.meta_event_handler.handle_meta_event(message)
+    elif post_type == "notice":
+        connection_registry.remember_route(message)
+        await context.notice_handler.handle_notice(message)
+    else:
+        logger.warning(f"未知的post_type: {post_type}")
 
 
 async def main():
     message_send_instance.maibot_router = router
-    _ = await asyncio.gather(napcat_server(), mmc_start_com(), message_process(), check_timeout_response())
+    message_send_instance.start_replay()
+    workers = [ingest_queue.worker(message_process) for _ in range(global_config.napcat_server.ingest_workers)]
+    _ = await asyncio.gather(
+        napcat_server(),
+        mmc_start_com(),
+        check_timeout_response(),
+        notice_outbox.run(),
+        report_metrics(),
+        *workers,
+    )
 
 def check_napcat_server_token(conn, request):
     token = global_config.napcat_server.token
@@ -81,6 +104,9 @@ async def graceful_shutdown():
                 task.cancel()
         await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), 15)
         await mmc_stop_com()  # 后置避免神秘exception
+        await media_downloader.close()
+        message_send_instance.spool.close()
+        await asyncio.to_thread(async_db_manager.close)  # 等待数据库写入完成
         logger.info("Adapter已成功关闭")
     except Exception as e:
         logger.error(f"Adapter关闭中出现错误: {e}")
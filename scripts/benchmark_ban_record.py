@@ -0,0 +1,98 @@
+"""
+禁言记录同步（DatabaseManager.update_ban_record）的性能测试
+
+对比旧的逐条查询实现与当前的集合比较+批量写入实现。
+需要在项目根目录下（已有config.toml）运行：
+
+    python scripts/benchmark_ban_record.py 10000 100000
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlmodel import Session, select  # noqa: E402
+
+from src.database import BanUser, DB_BanUser, DatabaseManager, is_identical  # noqa: E402
+
+LEGACY_LIMIT = 20000  # 旧实现为O(n²)，超过该数量时跳过
+
+
+def legacy_update_ban_record(manager: DatabaseManager, ban_list: List[BanUser]) -> None:
+    """旧实现：每条记录一次SELECT，删除检查为O(n²)，每次删除都提交"""
+    with Session(manager.engine) as session:
+        all_records = session.exec(select(DB_BanUser)).all()
+        for ban_user in ban_list:
+            statement = select(DB_BanUser).where(
+                DB_BanUser.user_id == ban_user.user_id, DB_BanUser.group_id == ban_user.group_id
+            )
+            if existing_record := session.exec(statement).first():
+                if existing_record.lift_time == ban_user.lift_time:
+                    continue
+                existing_record.lift_time = ban_user.lift_time
+                session.add(existing_record)
+            else:
+                session.add(DB_BanUser(user_id=ban_user.user_id, group_id=ban_user.group_id, lift_time=ban_user.lift_time))
+        for db_record in all_records:
+            record = BanUser(user_id=db_record.user_id, group_id=db_record.group_id, lift_time=db_record.lift_time)
+            if not any(is_identical(record, ban_user) for ban_user in ban_list):
+                statement = select(DB_BanUser).where(
+                    DB_BanUser.user_id == record.user_id, DB_BanUser.group_id == record.group_id
+                )
+                if ban_record := session.exec(statement).first():
+                    session.delete(ban_record)
+                    session.commit()
+        session.commit()
+
+
+def make_workload(count: int) -> tuple[List[BanUser], List[BanUser]]:
+    """
+    生成初始记录与目标记录：保留80%（其中一半修改lift_time），删除20%，新增20%
+    """
+    rng = random.Random(count)
+    now = int(time.time())
+    initial = [BanUser(user_id=i + 1, group_id=rng.randint(1, 500), lift_time=now + rng.randint(60, 86400)) for i in range(count)]
+    target: List[BanUser] = []
+    for index, record in enumerate(initial):
+        if index % 5 == 0:
+            continue  # 删除
+        lift_time = record.lift_time + 60 if index % 2 == 0 else record.lift_time
+        target.append(BanUser(user_id=record.user_id, group_id=record.group_id, lift_time=lift_time))
+    target += [
+        BanUser(user_id=count + i + 1, group_id=rng.randint(1, 500), lift_time=now + 3600) for i in range(count // 5)
+    ]
+    return initial, target
+
+
+def measure(count: int, name: str, func: Callable[[DatabaseManager, List[BanUser]], None]) -> float:
+    initial, target = make_workload(count)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        manager = DatabaseManager(os.path.join(temp_dir, "benchmark.db"))
+        manager.update_ban_record(initial)
+        start = time.perf_counter()
+        func(manager, target)
+        elapsed = time.perf_counter() - start
+        assert len(manager.get_ban_records()) == len(target), f"{name} 同步结果不正确"
+        manager.engine.dispose()
+    return elapsed
+
+
+def main() -> None:
+    counts = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    print(f"{'记录数':>10} | {'旧实现(秒)':>12} | {'批量实现(秒)':>12}")
+    for count in counts:
+        bulk = measure(count, "批量实现", DatabaseManager.update_ban_record)
+        if count <= LEGACY_LIMIT:
+            legacy = f"{measure(count, '旧实现', legacy_update_ban_record):12.2f}"
+        else:
+            legacy = f"{'跳过':>12}"
+        print(f"{count:>10} | {legacy} | {bulk:12.2f}")
+
+
+if __name__ == "__main__":
+    main()
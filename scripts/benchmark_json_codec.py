@@ -0,0 +1,130 @@
+"""
+Napcat通信JSON编解码的性能测试
+
+对比标准库json与已安装的orjson/msgspec的解析（loads）与序列化（dumps）吞吐量。
+可以传入录制的帧文件（每行一个Napcat发来的原始JSON帧），未传入时使用生成的示例帧：
+
+    python scripts/benchmark_json_codec.py [frames.jsonl]
+"""
+
+import sys
+import json
+import time
+import base64
+import random
+from typing import Any, Callable, Dict, List, Tuple
+
+ROUNDS = 5
+BYTES_PER_ROUND = 8 * 1024 * 1024  # 每轮至少处理的数据量，小帧会重复多次
+
+Codec = Tuple[Callable[[Any], str], Callable[[str], Any]]
+
+
+def available_codecs() -> Dict[str, Codec]:
+    codecs: Dict[str, Codec] = {"json": (json.dumps, json.loads)}
+    try:
+        import orjson
+
+        codecs["orjson"] = (lambda obj: orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8"), orjson.loads)
+    except ImportError:
+        pass
+    try:
+        import msgspec
+
+        encoder, decoder = msgspec.json.Encoder(), msgspec.json.Decoder()
+        codecs["msgspec"] = (lambda obj: encoder.encode(obj).decode("utf-8"), decoder.decode)
+    except ImportError:
+        pass
+    return codecs
+
+
+def make_sample_frames() -> List[Tuple[str, List[str]]]:
+    """
+    生成示例帧：心跳、群聊文本消息、带引用与图片的消息、携带base64语音的get_record响应
+    """
+    rng = random.Random(0)
+    heartbeat = {
+        "time": 1700000000,
+        "self_id": 10001,
+        "post_type": "meta_event",
+        "meta_event_type": "heartbeat",
+        "status": {"online": True, "good": True},
+        "interval": 30000,
+    }
+    text_message = {
+        "self_id": 10001,
+        "user_id": 20002,
+        "time": 1700000000,
+        "message_id": 123456789,
+        "message_type": "group",
+        "sender": {"user_id": 20002, "nickname": "测试用户", "card": "群名片", "role": "member"},
+        "raw_message": "今天天气怎么样？" * 4,
+        "message": [{"type": "text", "data": {"text": "今天天气怎么样？" * 4}}],
+        "group_id": 30003,
+        "post_type": "message",
+    }
+    rich_message = dict(text_message)
+    rich_message["message"] = [
+        {"type": "reply", "data": {"id": "987654321"}},
+        {"type": "at", "data": {"qq": "10001"}},
+        {"type": "text", "data": {"text": "看看这张图"}},
+        {
+            "type": "image",
+            "data": {
+                "file": "ABCDEF0123456789.jpg",
+                "sub_type": 0,
+                "url": "https://multimedia.nt.qq.com.cn/download?appid=1407&fileid=" + "x" * 200,
+                "file_size": "123456",
+            },
+        },
+    ]
+    voice = base64.b64encode(rng.randbytes(2 * 1024 * 1024)).decode()
+    record_response = {"status": "ok", "retcode": 0, "data": {"file": "voice.amr", "base64": voice}, "echo": "uuid"}
+    return [
+        ("心跳", [json.dumps(heartbeat)]),
+        ("文本消息", [json.dumps(text_message, ensure_ascii=False)]),
+        ("引用+图片消息", [json.dumps(rich_message, ensure_ascii=False)]),
+        ("语音响应(2MB)", [json.dumps(record_response)]),
+    ]
+
+
+def load_recorded_frames(path: str) -> List[Tuple[str, List[str]]]:
+    with open(path, "r", encoding="utf-8") as f:
+        frames = [line.strip() for line in f if line.strip()]
+    return [(f"录制帧({len(frames)}条)", frames)]
+
+
+def measure(func: Callable[[Any], Any], items: List[Any], size: int) -> float:
+    """
+    返回处理一遍items的最快耗时（秒）
+    """
+    repeat = max(1, BYTES_PER_ROUND // size)
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for item in items:
+                func(item)
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best
+
+
+def main() -> None:
+    codecs = available_codecs()
+    groups = load_recorded_frames(sys.argv[1]) if len(sys.argv) > 1 else make_sample_frames()
+    print(f"可用的编解码: {', '.join(codecs)}")
+    header = f"{'帧':<16} | {'编解码':<8} | {'loads(MB/s)':>12} | {'dumps(MB/s)':>12}"
+    print(header)
+    print("-" * len(header))
+    for name, frames in groups:
+        size = sum(len(frame.encode("utf-8")) for frame in frames)
+        size_mb = size / 1024 / 1024
+        decoded = [json.loads(frame) for frame in frames]
+        for codec_name, (dumps, loads) in codecs.items():
+            loads_speed = size_mb / measure(loads, frames, size)
+            dumps_speed = size_mb / measure(dumps, decoded, size)
+            print(f"{name:<16} | {codec_name:<8} | {loads_speed:12.1f} | {dumps_speed:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from .config import global_config
+
+
+class TTLCache:
+    """
+    带过期时间与容量上限的LRU缓存
+
+    同一个键的并发获取只会触发一次实际请求（single-flight），获取失败（返回None）的结果不会被缓存
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expire_time, value = item
+        if expire_time < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        使缓存失效，正在进行中的获取结果也不会再写入缓存
+        """
+        self._data.pop(key, None)
+        self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._inflight.clear()
+
+    async def get_or_fetch(self, key: Hashable, fetcher: Callable[[], Awaitable[Any]]) -> Any | None:
+        """
+        优先从缓存中读取，未命中时调用fetcher获取并写入缓存
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetcher())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_fetched(key, t))
+        return await asyncio.shield(task)
+
+    def _on_fetched(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is not task:
+            return  # 获取期间缓存已失效，丢弃结果
+        del self._inflight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        if (value := task.result()) is not None:
+            self.set(key, value)
+
+
+group_info_cache = TTLCache(global_config.cache.group_info_ttl, global_config.cache.group_info_max_size)
+member_info_cache = TTLCache(global_config.cache.member_info_ttl, global_config.cache.member_info_max_size)
+emoji_gif_cache = TTLCache(float("inf"), global_config.cache.emoji_gif_cache_size)  # 转换结果不会过期，仅按容量淘汰
+self_info_cache = TTLCache(global_config.cache.member_info_ttl, 16)
@@ -0,0 +1,129 @@
+import time
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Type, TypeVar
+
+from .logger import logger
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """
+    熔断器处于打开状态，请求被直接拒绝
+    """
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    连续失败（超时等）达到failure_threshold次后打开，打开期间请求立即失败；
+    经过reset_timeout后进入半开状态，由下一次请求在后台发起一次试探（调用方仍立即失败），
+    试探成功则关闭，失败则重新打开
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state: str = self.CLOSED
+        self.consecutive_failures: int = 0
+        self.opened_at: float = 0
+        self.open_count: int = 0  # 打开的次数
+        self.rejected_count: int = 0  # 被直接拒绝的请求数
+        self._probe_task: Optional[asyncio.Task] = None  # 保留引用，避免试探任务被回收后停留在半开状态
+
+    async def run(
+        self,
+        factory: Callable[[], Awaitable[T]],
+        failure_types: Tuple[Type[BaseException], ...],
+        count_failure: bool = True,
+    ) -> T:
+        """
+        在熔断器保护下执行请求
+        Parameters:
+            factory: 创建请求的函数
+            failure_types: 计为失败的异常类型，其他异常直接抛出且不影响熔断器状态
+            count_failure: 本次请求失败时是否计入失败次数
+        Raises:
+            CircuitOpenError: 熔断器处于打开或半开状态
+        """
+        if self.state != self.CLOSED:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                logger.info(f"熔断器 {self.name} 进入半开状态，在后台试探")
+                self._probe_task = asyncio.create_task(self._probe(factory, failure_types))
+            self.rejected_count += 1
+            raise CircuitOpenError(f"{self.name} 暂时不可用（熔断中）")
+        try:
+            result = await factory()
+        except failure_types:
+            if count_failure:
+                self._record_failure()
+            raise
+        self.consecutive_failures = 0
+        return result
+
+    async def _probe(self, factory: Callable[[], Awaitable[T]], failure_types: Tuple[Type[BaseException], ...]) -> None:
+        recovered = False
+        try:
+            await factory()
+            recovered = True
+        except failure_types:
+            pass
+        except Exception:
+            recovered = True  # 非超时类错误说明服务已能响应
+        finally:
+            # 试探被取消等情况下也要离开半开状态，否则该熔断器将永远拒绝请求
+            if recovered:
+                self.state = self.CLOSED
+                self.consecutive_failures = 0
+                logger.info(f"熔断器 {self.name} 试探成功，已关闭")
+            else:
+                self._open()
+            self._probe_task = None
+
+    def _record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self) -> None:
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.open_count += 1
+        logger.warning(f"熔断器 {self.name} 已打开，{self.reset_timeout} 秒后试探恢复")
+
+
+class CircuitBreakerRegistry:
+    """
+    按名称管理熔断器，例如 napcat:10001:get_msg、media:multimedia.nt.qq.com.cn
+    """
+
+    def __init__(self):
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str, failure_threshold: int, reset_timeout: float) -> CircuitBreaker:
+        """
+        获取熔断器，不存在时按给定参数创建
+        """
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+            self.breakers[name] = breaker
+        return breaker
+
+    def states(self) -> Dict[str, Tuple[str, int, int]]:
+        """
+        每个熔断器的 (状态, 打开次数, 拒绝请求数)
+        """
+        return {
+            name: (breaker.state, breaker.open_count, breaker.rejected_count) for name, breaker in self.breakers.items()
+        }
+
+
+circuit_breakers = CircuitBreakerRegistry()
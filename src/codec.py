@@ -0,0 +1,57 @@
+"""
+与Napcat通信使用的JSON编解码
+
+优先使用orjson，其次msgspec，均未安装时使用标准库json。
+dumps总是返回str，以文本帧发送给Napcat
+"""
+
+import json
+from typing import Any, Callable
+
+_dumps: Callable[[Any], str]
+_loads: Callable[[str | bytes], Any]
+
+try:
+    import orjson
+
+    CODEC_NAME = "orjson"
+
+    def _dumps(obj: Any) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+    _loads = orjson.loads
+except ImportError:
+    try:
+        import msgspec
+
+        CODEC_NAME = "msgspec"
+        _encoder = msgspec.json.Encoder()
+        _decoder = msgspec.json.Decoder()
+
+        def _dumps(obj: Any) -> str:
+            return _encoder.encode(obj).decode("utf-8")
+
+        _loads = _decoder.decode
+    except ImportError:
+        CODEC_NAME = "json"
+        _dumps = json.dumps
+        _loads = json.loads
+
+
+def dumps(obj: Any) -> str:
+    """
+    序列化为JSON字符串
+    """
+    try:
+        return _dumps(obj)
+    except Exception:
+        # 快速实现不支持的情况（例如超过64位的整数）回退到标准库
+        return json.dumps(obj)
+
+
+def loads(data: str | bytes) -> Any:
+    """
+    解析JSON字符串
+    """
+    return _loads(data)
+
@@ -12,9 +12,12 @@ from rich.traceback import install
 
 from src.config.config_base import ConfigBase
 from src.config.official_configs import (
+    CacheConfig,
     ChatConfig,
     DebugConfig,
     MaiBotServerConfig,
+    MediaConfig,
+    NapcatRPCConfig,
     NapcatServerConfig,
     NicknameConfig,
     VoiceConfig,
@@ -114,9 +117,12 @@ class Config(ConfigBase):
 
     nickname: NicknameConfig
     napcat_server: NapcatServerConfig
+    napcat_rpc: NapcatRPCConfig
     maibot_server: MaiBotServerConfig
     chat: ChatConfig
     voice: VoiceConfig
+    cache: CacheConfig
+    media: MediaConfig
     debug: DebugConfig
 
 
@@ -34,6 +34,71 @@ class NapcatServerConfig(ConfigBase):
     heartbeat_interval: int = 30
     """Napcat心跳间隔时间，单位为秒"""
 
+    ingest_workers: int = 8
+    """并行处理Napcat事件的worker数量"""
+
+    ingest_shards: int = 64
+    """事件队列的分片数量，同一会话的事件总是落在同一分片中按顺序处理"""
+
+    ingest_meta_weight: int = 8
+    """meta事件（心跳/生命周期）通道的调度权重"""
+
+    ingest_notice_weight: int = 4
+    """通知事件通道的调度权重"""
+
+    ingest_message_weight: int = 1
+    """聊天消息通道的调度权重"""
+
+    ingest_starvation_timeout: float = 2.0
+    """通道中最早的事件等待超过该时间（秒）后，该通道在轮询中的权重加倍，避免低优先级通道饿死"""
+
+    ingest_max_size: int = 10000
+    """聊天消息通道的容量上限，0表示不限制"""
+
+    ingest_shed_policy: Literal["drop_oldest", "drop_newest", "max_age"] = "drop_oldest"
+    """聊天消息积压时的丢弃策略：通道已满时丢弃最早/最新的消息，或在出队时丢弃等待超过ingest_max_age的消息"""
+
+    ingest_max_age: int = 60
+    """ingest_shed_policy为max_age时，消息在队列中的最长等待时间（秒）"""
+
+    degrade_lag_thresholds: list[int] = field(default_factory=lambda: [5, 15, 30])
+    """消息在队列中等待超过对应秒数时依次降级：不下载图片、不展开引用、@昵称只从缓存获取；为空时不降级"""
+
+    degrade_recover_interval: int = 10
+    """两次恢复之间的最短间隔（秒），等待时间回落到当前级阈值的一半以下时逐级恢复"""
+
+    ban_sync_concurrency: int = 8
+    """连接时同步禁言列表的并发群数量"""
+
+
+@dataclass
+class NapcatRPCConfig(ConfigBase):
+    default_timeout: int = 10
+    """Napcat请求的默认超时时间（秒）"""
+
+    action_timeouts: dict[str, int] = field(
+        default_factory=lambda: {"get_msg": 30, "get_record": 30, "get_group_member_list": 30, "get_group_list": 30}
+    )
+    """按action单独设置的超时时间（秒）"""
+
+    default_retries: int = 1
+    """只读请求超时后的默认重试次数，发送消息等有副作用的请求不会重试"""
+
+    action_retries: dict[str, int] = field(default_factory=dict)
+    """按action单独设置的重试次数"""
+
+    retry_delay: float = 0.5
+    """重试前的等待时间（秒）"""
+
+    event_deadline: int = 60
+    """处理单个Napcat事件时所有请求共享的时间预算（秒），0表示不限制"""
+
+    breaker_failure_threshold: int = 5
+    """同一action连续超时（含重试）达到该次数后熔断，熔断期间该类请求直接失败"""
+
+    breaker_reset_timeout: int = 30
+    """熔断后经过该时间（秒）在后台发送一次试探请求，成功则恢复"""
+
 
 @dataclass
 class MaiBotServerConfig(ConfigBase):
@@ -46,6 +111,33 @@ class MaiBotServerConfig(ConfigBase):
     port: int = 8000
     """MaiMCore的端口号"""
 
+    notice_send_concurrency: int = 4
+    """同时发送到麦麦的通知数量上限，发送失败后退化为逐条试探"""
+
+    notice_retry_base_delay: float = 1.0
+    """通知发送失败后的初始重试间隔（秒），之后按指数增长并加入随机抖动"""
+
+    notice_retry_max_delay: float = 300.0
+    """通知重试间隔的上限（秒）"""
+
+    notice_max_age: int = 86400
+    """通知的最长保留时间（秒），超时仍未发送成功的通知将被丢弃"""
+
+    spool_max_size: int = 1000
+    """与麦麦断开期间内存中缓冲的消息数量上限"""
+
+    spool_disk_overflow: bool = False
+    """内存缓冲已满时是否将消息写入磁盘，启用后关闭时未发送的消息也会保存到磁盘"""
+
+    spool_disk_max_size: int = 50000
+    """磁盘中缓冲的消息数量上限"""
+
+    spool_max_age: int = 600
+    """缓冲消息的最长保留时间（秒），超时的消息不再补发"""
+
+    spool_retry_interval: int = 2
+    """补发失败后的重试间隔（秒）"""
+
 
 @dataclass
 class ChatConfig(ConfigBase):
@@ -77,7 +169,67 @@ class VoiceConfig(ConfigBase):
     """是否启用TTS功能"""
 
 
+@dataclass
+class CacheConfig(ConfigBase):
+    group_info_ttl: int = 600
+    """群信息缓存的有效时间，单位为秒"""
+
+    group_info_max_size: int = 2000
+    """群信息缓存的最大条目数"""
+
+    member_info_ttl: int = 300
+    """群成员信息缓存的有效时间，单位为秒"""
+
+    member_info_max_size: int = 20000
+    """群成员信息缓存的最大条目数，超出后淘汰最久未使用的条目"""
+
+    bot_verdict_ttl: int = 604800
+    """QQ官方机器人判定结果的有效时间，单位为秒，过期后在后台重新判定"""
+
+    emoji_gif_cache_size: int = 256
+    """发送表情包时GIF转换结果的缓存条目数"""
+
+    recent_message_size: int = 5000
+    """内存中保留的最近消息条数，用于解析引用回复时免去get_msg请求"""
+
+    recent_message_spill: bool = False
+    """是否将被挤出内存的最近消息写入数据库"""
+
+    recent_message_spill_ttl: int = 86400
+    """写入数据库的最近消息保留时间，单位为秒"""
+
+
+@dataclass
+class MediaConfig(ConfigBase):
+    download_timeout: int = 10
+    """媒体文件下载超时时间，单位为秒"""
+
+    max_connections: int = 64
+    """媒体下载连接池的最大连接数"""
+
+    max_connections_per_host: int = 8
+    """对同一主机的最大并发连接数"""
+
+    max_concurrent_fetches: int = 4
+    """解析单条消息（含转发消息）时并发获取图片、回复、@等内容的最大数量"""
+
+    cache_enabled: bool = True
+    """是否启用本地媒体缓存（data/media_cache），重复的图片与表情包无需再次下载"""
+
+    cache_max_size_mb: int = 512
+    """本地媒体缓存的容量上限，单位为MB，超出后淘汰最久未访问的文件"""
+
+    breaker_failure_threshold: int = 3
+    """同一主机连续下载超时或连接失败达到该次数后熔断，熔断期间直接使用[图片]等占位文本"""
+
+    breaker_reset_timeout: int = 30
+    """熔断后经过该时间（秒）在后台试探下载一次，成功则恢复"""
+
+
 @dataclass
 class DebugConfig(ConfigBase):
     level: Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"] = "INFO"
     """日志级别，默认为INFO"""
+
+    metrics_interval: int = 60
+    """定期在日志中输出运行指标（事件队列积压等）的间隔（秒），0表示不输出"""
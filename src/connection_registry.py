@@ -0,0 +1,121 @@
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import websockets as Server
+
+from .logger import logger
+from .recv_handler.message_handler import MessageHandler
+from .recv_handler.meta_event_handler import MetaEventHandler
+from .recv_handler.notice_handler import NoticeHandler
+from .send_handler.nc_sending import NCMessageSender
+
+
+class BotContext:
+    """
+    单个QQ账号（Napcat连接）的处理上下文
+
+    每个账号拥有独立的消息/通知/meta事件处理器、发送器与禁言调度；
+    缓存、连接池与数据库在所有账号间共享。账号重新连接时沿用同一个上下文
+    """
+
+    def __init__(self, self_id: int):
+        self.self_id = self_id
+        self.server_connection: Server.ServerConnection = None
+        self.message_handler = MessageHandler()
+        self.notice_handler = NoticeHandler(self.message_handler, self_id)
+        self.meta_event_handler = MetaEventHandler()
+        self.nc_message_sender = NCMessageSender()
+
+    @property
+    def connected(self) -> bool:
+        return self.server_connection is not None and self.server_connection.state == Server.State.OPEN
+
+    async def set_server_connection(self, server_connection: Server.ServerConnection) -> None:
+        self.server_connection = server_connection
+        await self.message_handler.set_server_connection(server_connection)
+        asyncio.create_task(self.notice_handler.set_server_connection(server_connection))
+        await self.nc_message_sender.set_server_connection(server_connection)
+
+
+class ConnectionRegistry:
+    """
+    以self_id为键的连接注册表
+
+    负责将Napcat事件分发到对应账号的上下文，
+    并按群号/用户ID将麦麦发来的消息路由到最近收到该会话消息的账号
+    """
+
+    MAX_ROUTES = 50000  # 记录的会话路由数量上限
+
+    def __init__(self):
+        self.contexts: Dict[int, BotContext] = {}
+        self._routes: OrderedDict[Tuple[str, int], int] = OrderedDict()  # 会话 -> self_id
+
+    @staticmethod
+    def self_id_from_request(server_connection: Server.ServerConnection) -> Optional[int]:
+        """
+        从握手请求头X-Self-ID中获取账号，Napcat的反向WebSocket会携带该请求头
+        """
+        request = getattr(server_connection, "request", None)
+        self_id = request.headers.get("X-Self-ID") if request else None
+        return int(self_id) if self_id and self_id.isdigit() else None
+
+    async def attach(self, self_id: int, server_connection: Server.ServerConnection) -> BotContext:
+        """
+        注册账号的连接，账号已存在时替换为新的连接
+        """
+        context = self.contexts.get(self_id)
+        if context is None:
+            context = BotContext(self_id)
+            self.contexts[self_id] = context
+        elif context.server_connection is not server_connection and context.connected:
+            logger.warning(f"Bot {self_id} 建立了新的连接，旧连接将不再使用")
+        await context.set_server_connection(server_connection)
+        logger.info(f"Bot {self_id} 已注册，当前连接数: {sum(ctx.connected for ctx in self.contexts.values())}")
+        return context
+
+    def detach(self, context: Optional[BotContext], server_connection: Server.ServerConnection) -> None:
+        """
+        连接断开时调用，上下文保留以便账号重新连接
+        """
+        if context is not None and context.server_connection is server_connection:
+            logger.warning(f"Bot {context.self_id} 的连接已断开")
+
+    def get(self, self_id: Optional[int]) -> Optional[BotContext]:
+        return self.contexts.get(self_id)
+
+    def remember_route(self, message: dict) -> None:
+        """
+        记录收到事件的会话由哪个账号接收，用于路由麦麦的回复
+        """
+        self_id = message.get("self_id")
+        if group_id := message.get("group_id"):
+            key = ("group", group_id)
+        elif user_id := message.get("user_id"):
+            key = ("private", user_id)
+        else:
+            return
+        self._routes[key] = self_id
+        self._routes.move_to_end(key)
+        while len(self._routes) > self.MAX_ROUTES:
+            self._routes.popitem(last=False)
+
+    def route(self, group_id: Optional[int] = None, user_id: Optional[int] = None) -> Optional[BotContext]:
+        """
+        选择发送消息使用的账号
+        优先使用最近收到该会话消息的账号，否则使用任一在线账号
+        """
+        key = ("group", int(group_id)) if group_id else ("private", int(user_id)) if user_id else None
+        if key and (context := self.contexts.get(self._routes.get(key))) and context.connected:
+            return context
+        connected = [context for context in self.contexts.values() if context.connected]
+        if not connected:
+            logger.error("没有可用的Napcat连接")
+            return None
+        if len(connected) > 1:
+            logger.warning(f"无法确定会话 {key} 对应的账号，使用Bot {connected[0].self_id} 发送")
+        return connected[0]
+
+
+connection_registry = ConnectionRegistry()
@@ -1,16 +1,22 @@
 import os
-from typing import Optional, List
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Optional, List, Dict, Iterator, Set, Tuple
 from dataclasses import dataclass
-from sqlmodel import Field, Session, SQLModel, create_engine, select
+from sqlalchemy import bindparam, event, insert, update
+from sqlmodel import Field, Session, SQLModel, create_engine, select, delete
 
 from src.logger import logger
 
 """
 表记录的方式：
-| group_id | user_id | lift_time |
-|----------|---------|-----------|
+| group_id | user_id | lift_time | self_id |
+|----------|---------|-----------|---------|
 
-其中使用 user_id == 0 表示群全体禁言
+其中使用 user_id == 0 表示群全体禁言，self_id 为负责同步该记录的账号（旧版本的记录为空）
 """
 
 
@@ -23,6 +29,7 @@ class BanUser:
     user_id: int
     group_id: int
     lift_time: Optional[int] = Field(default=-1)
+    self_id: Optional[int] = None  # 负责同步该记录的账号
 
 
 class DB_BanUser(SQLModel, table=True):
@@ -34,6 +41,72 @@ class DB_BanUser(SQLModel, table=True):
     user_id: int = Field(index=True, primary_key=True)  # 被禁言用户的用户 ID
     group_id: int = Field(index=True, primary_key=True)  # 用户被禁言的群组 ID
     lift_time: Optional[int]  # 禁言解除的时间（时间戳）
+    self_id: Optional[int] = Field(default=None, index=True)  # 负责同步该记录的账号
+
+
+@dataclass
+class BotVerdict:
+    """
+    用户是否为QQ官方机器人的判定结果
+    """
+
+    user_id: int
+    is_bot: bool
+    check_time: int  # 判定时间（时间戳）
+
+
+class DB_BotVerdict(SQLModel, table=True):
+    """
+    表示数据库中的QQ官方机器人判定记录。
+    """
+
+    user_id: int = Field(primary_key=True)  # 用户 ID
+    is_bot: bool  # 是否为QQ官方机器人
+    check_time: int  # 判定时间（时间戳）
+
+
+class DB_MediaCacheKey(SQLModel, table=True):
+    """
+    表示媒体缓存中QQ文件ID/URL到内容哈希的映射。
+    """
+
+    cache_key: str = Field(primary_key=True)  # QQ文件ID或URL
+    content_hash: str = Field(index=True)  # 文件内容的sha256
+
+
+class DB_RecentMessage(SQLModel, table=True):
+    """
+    表示从内存中溢出的最近消息，用于解析引用回复。
+    """
+
+    message_id: str = Field(primary_key=True)  # QQ消息ID
+    content: str  # 消息内容（JSON，格式与get_msg的返回值一致）
+    save_time: int = Field(index=True)  # 写入时间（时间戳）
+
+
+@dataclass
+class OutboxNotice:
+    """
+    等待发送到麦麦的通知
+    """
+
+    notice_id: str
+    content: str  # MessageBase序列化后的JSON
+    create_time: float  # 创建时间（时间戳）
+    attempts: int = 0  # 已失败的发送次数
+    next_attempt_time: float = 0  # 下次尝试发送的时间（时间戳）
+
+
+class DB_NoticeOutbox(SQLModel, table=True):
+    """
+    表示数据库中等待发送到麦麦的通知，发送成功后删除。
+    """
+
+    notice_id: str = Field(primary_key=True)  # 通知ID
+    content: str  # MessageBase序列化后的JSON
+    create_time: float  # 创建时间（时间戳）
+    attempts: int  # 已失败的发送次数
+    next_attempt_time: float  # 下次尝试发送的时间（时间戳）
 
 
 def is_identical(obj1: BanUser, obj2: BanUser) -> bool:
@@ -48,64 +121,128 @@ class DatabaseManager:
     数据库管理类，负责与数据库交互。
     """
 
-    def __init__(self):
-        os.makedirs(os.path.join(os.path.dirname(__file__), "..", "data"), exist_ok=True)  # 确保数据目录存在
-        DATABASE_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "NapcatAdapter.db")
-        self.sqlite_url = f"sqlite:///{DATABASE_FILE}"  # SQLite 数据库 URL
+    def __init__(self, database_file: Optional[str] = None):
+        if database_file is None:
+            os.makedirs(os.path.join(os.path.dirname(__file__), "..", "data"), exist_ok=True)  # 确保数据目录存在
+            database_file = os.path.join(os.path.dirname(__file__), "..", "data", "NapcatAdapter.db")
+        self.sqlite_url = f"sqlite:///{database_file}"  # SQLite 数据库 URL
         self.engine = create_engine(self.sqlite_url, echo=False)  # 创建数据库引擎
+        event.listen(self.engine, "connect", self._set_sqlite_pragma)
         self._ensure_database()  # 确保数据库和表已创建
 
+    @staticmethod
+    def _set_sqlite_pragma(dbapi_connection, _) -> None:
+        """
+        使用WAL模式，写入时不阻塞读取，并减少fsync次数
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    @contextmanager
+    def _write_session(self, session: Optional[Session] = None) -> Iterator[Session]:
+        """
+        写操作使用的会话，传入session时由调用方负责提交（用于批量提交），否则新建会话并在结束时提交
+        """
+        if session is not None:
+            yield session
+            return
+        with Session(self.engine) as new_session:
+            yield new_session
+            new_session.commit()
+
     def _ensure_database(self) -> None:
         """
         确保数据库和表已创建。
         """
         logger.info("确保数据库文件和表已创建...")
         SQLModel.metadata.create_all(self.engine)
+        self._migrate()
         logger.success("数据库和表已创建或已存在")
 
-    def update_ban_record(self, ban_list: List[BanUser]) -> None:
-        # sourcery skip: class-extract-method
+    def _migrate(self) -> None:
+        """
+        为旧版本数据库中已存在的表补充新增的列
+        """
+        table_name = DB_BanUser.__tablename__
+        with self.engine.begin() as connection:
+            columns = {row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table_name})")}
+            if "self_id" not in columns:
+                logger.info("禁言记录表缺少self_id列，正在添加")
+                connection.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN self_id INTEGER")
+                connection.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS ix_{table_name}_self_id ON {table_name} (self_id)")
+
+    def update_ban_record(
+        self,
+        ban_list: List[BanUser],
+        group_ids: Optional[Set[int]] = None,
+        self_id: Optional[int] = None,
+        session: Optional[Session] = None,
+    ) -> None:
         """
         更新禁言列表到数据库。
         支持在不存在时创建新记录，对于多余的项目自动删除。
+
+        多账号时每个连接只同步自己负责的记录，传入group_ids与self_id时同步范围为：
+        - 这些群中属于该账号或尚无归属的记录，同步后归属该账号
+        - 属于该账号但不在这些群中的记录（账号已退出该群），将被删除
+        其他账号负责的记录不受影响
+
+        在内存中按 (user_id, group_id) 比较新旧两个集合，
+        然后在同一个事务中批量执行插入、更新与删除。
         """
-        with Session(self.engine) as session:
-            all_records = session.exec(select(DB_BanUser)).all()
-            for ban_user in ban_list:
-                statement = select(DB_BanUser).where(
-                    DB_BanUser.user_id == ban_user.user_id, DB_BanUser.group_id == ban_user.group_id
+
+        def in_scope(group_id: int, owner: Optional[int]) -> bool:
+            if group_ids is None:
+                return True
+            if group_id in group_ids:
+                return owner is None or owner == self_id
+            return self_id is not None and owner == self_id
+
+        table = DB_BanUser.__table__
+        with self._write_session(session) as session:
+            existing: Dict[tuple, Tuple[Optional[int], Optional[int]]] = {
+                (user_id, group_id): (lift_time, owner)
+                for user_id, group_id, lift_time, owner in session.exec(
+                    select(DB_BanUser.user_id, DB_BanUser.group_id, DB_BanUser.lift_time, DB_BanUser.self_id)
+                ).all()
+                if in_scope(group_id, owner)
+            }
+            wanted: Dict[tuple, Optional[int]] = {
+                (ban_user.user_id, ban_user.group_id): ban_user.lift_time for ban_user in ban_list
+            }
+            to_insert = [
+                {"user_id": user_id, "group_id": group_id, "lift_time": wanted[(user_id, group_id)], "self_id": self_id}
+                for user_id, group_id in wanted.keys() - existing.keys()
+            ]
+            to_update = [
+                {"b_user_id": user_id, "b_group_id": group_id, "b_lift_time": lift_time, "b_self_id": self_id}
+                for (user_id, group_id), lift_time in wanted.items()
+                if (user_id, group_id) in existing and existing[(user_id, group_id)] != (lift_time, self_id)
+            ]
+            to_delete = [
+                {"b_user_id": user_id, "b_group_id": group_id} for user_id, group_id in existing.keys() - wanted.keys()
+            ]
+
+            connection = session.connection()
+            if to_insert:
+                connection.execute(insert(table), to_insert)
+            if to_update:
+                connection.execute(
+                    update(table)
+                    .where(table.c.user_id == bindparam("b_user_id"), table.c.group_id == bindparam("b_group_id"))
+                    .values(lift_time=bindparam("b_lift_time"), self_id=bindparam("b_self_id")),
+                    to_update,
                 )
-                if existing_record := session.exec(statement).first():
-                    if existing_record.lift_time == ban_user.lift_time:
-                        logger.debug(f"禁言记录未变更: {existing_record}")
-                        continue
-                    # 更新现有记录的 lift_time
-                    existing_record.lift_time = ban_user.lift_time
-                    session.add(existing_record)
-                    logger.debug(f"更新禁言记录: {existing_record}")
-                else:
-                    # 创建新记录
-                    db_record = DB_BanUser(
-                        user_id=ban_user.user_id, group_id=ban_user.group_id, lift_time=ban_user.lift_time
-                    )
-                    session.add(db_record)
-                    logger.debug(f"创建新禁言记录: {ban_user}")
-            # 删除不在 ban_list 中的记录
-            for db_record in all_records:
-                record = BanUser(user_id=db_record.user_id, group_id=db_record.group_id, lift_time=db_record.lift_time)
-                if not any(is_identical(record, ban_user) for ban_user in ban_list):
-                    statement = select(DB_BanUser).where(
-                        DB_BanUser.user_id == record.user_id, DB_BanUser.group_id == record.group_id
-                    )
-                    if ban_record := session.exec(statement).first():
-                        session.delete(ban_record)
-                        session.commit()
-                        logger.debug(f"删除禁言记录: {ban_record}")
-                    else:
-                        logger.info(f"未找到禁言记录: {ban_record}")
-
-            session.commit()
-            logger.info("禁言记录已更新")
+            if to_delete:
+                connection.execute(
+                    delete(table).where(
+                        table.c.user_id == bindparam("b_user_id"), table.c.group_id == bindparam("b_group_id")
+                    ),
+                    to_delete,
+                )
+            logger.info(f"禁言记录已更新，新增 {len(to_insert)} 条，更新 {len(to_update)} 条，删除 {len(to_delete)} 条")
 
     def get_ban_records(self) -> List[BanUser]:
         """
@@ -114,49 +251,293 @@ class DatabaseManager:
         with Session(self.engine) as session:
             statement = select(DB_BanUser)
             records = session.exec(statement).all()
-            return [BanUser(user_id=item.user_id, group_id=item.group_id, lift_time=item.lift_time) for item in records]
+            return [
+                BanUser(user_id=item.user_id, group_id=item.group_id, lift_time=item.lift_time, self_id=item.self_id)
+                for item in records
+            ]
 
-    def create_ban_record(self, ban_record: BanUser) -> None:
+    def create_ban_record(self, ban_record: BanUser, session: Optional[Session] = None) -> None:
         """
         为特定群组中的用户创建禁言记录。
         一个简化版本的添加方式，防止 update_ban_record 方法的复杂性。
         其同时还是简化版的更新方式。
         """
-        with Session(self.engine) as session:
+        with self._write_session(session) as session:
             # 检查记录是否已存在
             statement = select(DB_BanUser).where(
                 DB_BanUser.user_id == ban_record.user_id, DB_BanUser.group_id == ban_record.group_id
             )
             existing_record = session.exec(statement).first()
             if existing_record:
-                # 如果记录已存在，更新 lift_time
+                # 如果记录已存在，更新 lift_time，已有归属的记录保持原归属
                 existing_record.lift_time = ban_record.lift_time
+                if existing_record.self_id is None:
+                    existing_record.self_id = ban_record.self_id
                 session.add(existing_record)
                 logger.debug(f"更新禁言记录: {ban_record}")
             else:
                 # 如果记录不存在，创建新记录
                 db_record = DB_BanUser(
-                    user_id=ban_record.user_id, group_id=ban_record.group_id, lift_time=ban_record.lift_time
+                    user_id=ban_record.user_id,
+                    group_id=ban_record.group_id,
+                    lift_time=ban_record.lift_time,
+                    self_id=ban_record.self_id,
                 )
                 session.add(db_record)
                 logger.debug(f"创建新禁言记录: {ban_record}")
-            session.commit()
 
-    def delete_ban_record(self, ban_record: BanUser):
+    def delete_ban_record(self, ban_record: BanUser, session: Optional[Session] = None):
         """
         删除特定用户在特定群组中的禁言记录。
         一个简化版本的删除方式，防止 update_ban_record 方法的复杂性。
         """
         user_id = ban_record.user_id
         group_id = ban_record.group_id
-        with Session(self.engine) as session:
+        with self._write_session(session) as session:
             statement = select(DB_BanUser).where(DB_BanUser.user_id == user_id, DB_BanUser.group_id == group_id)
             if ban_record := session.exec(statement).first():
                 session.delete(ban_record)
-                session.commit()
                 logger.debug(f"删除禁言记录: {ban_record}")
             else:
                 logger.info(f"未找到禁言记录: user_id: {user_id}, group_id: {group_id}")
 
+    def get_bot_verdicts(self) -> List[BotVerdict]:
+        """
+        读取所有QQ官方机器人判定记录。
+        """
+        with Session(self.engine) as session:
+            records = session.exec(select(DB_BotVerdict)).all()
+            return [BotVerdict(user_id=item.user_id, is_bot=item.is_bot, check_time=item.check_time) for item in records]
+
+    def update_bot_verdict(self, verdict: BotVerdict, session: Optional[Session] = None) -> None:
+        """
+        创建或更新用户的QQ官方机器人判定记录。
+        """
+        with self._write_session(session) as session:
+            db_record = session.get(DB_BotVerdict, verdict.user_id)
+            if db_record:
+                db_record.is_bot = verdict.is_bot
+                db_record.check_time = verdict.check_time
+            else:
+                db_record = DB_BotVerdict(user_id=verdict.user_id, is_bot=verdict.is_bot, check_time=verdict.check_time)
+            session.add(db_record)
+            logger.debug(f"更新机器人判定记录: {verdict}")
+
+    def get_media_cache_keys(self) -> Dict[str, str]:
+        """
+        读取所有媒体缓存键到内容哈希的映射。
+        """
+        with Session(self.engine) as session:
+            records = session.exec(select(DB_MediaCacheKey)).all()
+            return {item.cache_key: item.content_hash for item in records}
+
+    def add_media_cache_key(self, cache_key: str, content_hash: str, session: Optional[Session] = None) -> None:
+        """
+        创建或更新媒体缓存键到内容哈希的映射。
+        """
+        with self._write_session(session) as session:
+            session.merge(DB_MediaCacheKey(cache_key=cache_key, content_hash=content_hash))
+
+    def delete_media_cache_keys(self, content_hash: str, session: Optional[Session] = None) -> None:
+        """
+        删除指向某一内容哈希的所有媒体缓存键。
+        """
+        with self._write_session(session) as session:
+            session.exec(delete(DB_MediaCacheKey).where(DB_MediaCacheKey.content_hash == content_hash))
+
+    def save_recent_message(
+        self, message_id: str, content: str, save_time: int, session: Optional[Session] = None
+    ) -> None:
+        """
+        保存一条最近消息。
+        """
+        with self._write_session(session) as session:
+            session.merge(DB_RecentMessage(message_id=message_id, content=content, save_time=save_time))
+
+    def get_recent_message(self, message_id: str) -> Optional[str]:
+        """
+        读取一条最近消息，不存在时返回None。
+        """
+        with Session(self.engine) as session:
+            record = session.get(DB_RecentMessage, message_id)
+            return record.content if record else None
+
+    def prune_recent_messages(self, expire_time: int, session: Optional[Session] = None) -> None:
+        """
+        删除写入时间早于expire_time的最近消息。
+        """
+        with self._write_session(session) as session:
+            session.exec(delete(DB_RecentMessage).where(DB_RecentMessage.save_time < expire_time))
+            logger.debug("已清理过期的最近消息")
+
+    def get_outbox_notices(self) -> List[OutboxNotice]:
+        """
+        读取所有等待发送的通知，按创建时间排序。
+        """
+        with Session(self.engine) as session:
+            records = session.exec(select(DB_NoticeOutbox).order_by(DB_NoticeOutbox.create_time)).all()
+            return [
+                OutboxNotice(
+                    notice_id=item.notice_id,
+                    content=item.content,
+                    create_time=item.create_time,
+                    attempts=item.attempts,
+                    next_attempt_time=item.next_attempt_time,
+                )
+                for item in records
+            ]
+
+    def save_outbox_notice(self, notice: OutboxNotice, session: Optional[Session] = None) -> None:
+        """
+        创建或更新一条等待发送的通知（包括重试状态）。
+        """
+        with self._write_session(session) as session:
+            session.merge(
+                DB_NoticeOutbox(
+                    notice_id=notice.notice_id,
+                    content=notice.content,
+                    create_time=notice.create_time,
+                    attempts=notice.attempts,
+                    next_attempt_time=notice.next_attempt_time,
+                )
+            )
+
+    def delete_outbox_notice(self, notice_id: str, session: Optional[Session] = None) -> None:
+        """
+        删除一条已发送或已过期的通知。
+        """
+        with self._write_session(session) as session:
+            session.exec(delete(DB_NoticeOutbox).where(DB_NoticeOutbox.notice_id == notice_id))
+
+
+class AsyncDatabaseManager:
+    """
+    异步数据库接口，所有数据库操作都在独立的线程中执行，不会阻塞事件循环。
+
+    所有操作按提交顺序执行；连续的写操作会在同一个事务中批量提交。
+    方法返回可等待对象，写操作也可以不等待其完成。
+    """
+
+    MAX_BATCH_SIZE = 256
+    _STOP = object()  # 停止线程的标记
+
+    def __init__(self, manager: DatabaseManager):
+        self.manager = manager
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None  # 首次提交操作时启动，仅导入本模块时不创建线程
+
+    def _submit(self, func: Callable, args: tuple, is_write: bool) -> asyncio.Future:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="database_writer", daemon=True)
+            self._thread.start()
+        future: Future = Future()
+        self._queue.put((func, args, is_write, future))
+        async_future = asyncio.wrap_future(future)
+        # 错误已在数据库线程中记录，不等待结果的写操作无需再次报告
+        async_future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return async_future
+
+    def _run(self) -> None:
+        pending = None
+        while True:
+            job = pending if pending is not None else self._queue.get()
+            pending = None
+            if job is self._STOP:
+                break
+            func, args, is_write, future = job
+            if not is_write:
+                self._execute(func, args, future)
+                continue
+            batch = [job]
+            while len(batch) < self.MAX_BATCH_SIZE:
+                try:
+                    next_job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if next_job is self._STOP or not next_job[2]:
+                    pending = next_job  # 读操作需要在本批写操作提交后执行
+                    break
+                batch.append(next_job)
+            self._commit_batch(batch)
+
+    @staticmethod
+    def _execute(func: Callable, args: tuple, future: Future) -> None:
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            logger.error(f"数据库操作失败: {e}")
+            future.set_exception(e)
+
+    def _commit_batch(self, batch: List[Tuple[Callable, tuple, bool, Future]]) -> None:
+        if len(batch) == 1:
+            func, args, _, future = batch[0]
+            self._execute(func, args, future)
+            return
+        results: List[Any] = []
+        try:
+            with Session(self.manager.engine) as session:
+                for func, args, _, _ in batch:
+                    results.append(func(*args, session=session))
+                session.commit()
+        except Exception as e:
+            # 批量提交失败时逐条重试，避免单条错误影响其他写操作
+            logger.warning(f"批量写入数据库失败，改为逐条写入: {e}")
+            for func, args, _, future in batch:
+                self._execute(func, args, future)
+            return
+        for (_, _, _, future), result in zip(batch, results, strict=True):
+            future.set_result(result)
+
+    def close(self) -> None:
+        """
+        等待已提交的操作全部完成后停止数据库线程
+        """
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+    def get_ban_records(self) -> asyncio.Future:
+        return self._submit(self.manager.get_ban_records, (), False)
+
+    def update_ban_record(
+        self, ban_list: List[BanUser], group_ids: Optional[Set[int]] = None, self_id: Optional[int] = None
+    ) -> asyncio.Future:
+        return self._submit(self.manager.update_ban_record, (ban_list, group_ids, self_id), True)
+
+    def create_ban_record(self, ban_record: BanUser) -> asyncio.Future:
+        return self._submit(self.manager.create_ban_record, (ban_record,), True)
+
+    def delete_ban_record(self, ban_record: BanUser) -> asyncio.Future:
+        return self._submit(self.manager.delete_ban_record, (ban_record,), True)
+
+    def update_bot_verdict(self, verdict: BotVerdict) -> asyncio.Future:
+        return self._submit(self.manager.update_bot_verdict, (verdict,), True)
+
+    def add_media_cache_key(self, cache_key: str, content_hash: str) -> asyncio.Future:
+        return self._submit(self.manager.add_media_cache_key, (cache_key, content_hash), True)
+
+    def delete_media_cache_keys(self, content_hash: str) -> asyncio.Future:
+        return self._submit(self.manager.delete_media_cache_keys, (content_hash,), True)
+
+    def save_recent_message(self, message_id: str, content: str, save_time: int) -> asyncio.Future:
+        return self._submit(self.manager.save_recent_message, (message_id, content, save_time), True)
+
+    def get_recent_message(self, message_id: str) -> asyncio.Future:
+        return self._submit(self.manager.get_recent_message, (message_id,), False)
+
+    def prune_recent_messages(self, expire_time: int) -> asyncio.Future:
+        return self._submit(self.manager.prune_recent_messages, (expire_time,), True)
+
+    def get_outbox_notices(self) -> asyncio.Future:
+        return self._submit(self.manager.get_outbox_notices, (), False)
+
+    def save_outbox_notice(self, notice: OutboxNotice) -> asyncio.Future:
+        return self._submit(self.manager.save_outbox_notice, (notice,), True)
+
+    def delete_outbox_notice(self, notice_id: str) -> asyncio.Future:
+        return self._submit(self.manager.delete_outbox_notice, (notice_id,), True)
+
 
 db_manager = DatabaseManager()
+async_db_manager = AsyncDatabaseManager(db_manager)
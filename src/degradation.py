@@ -0,0 +1,74 @@
+import time
+from collections import Counter
+from typing import List
+
+from .config import global_config
+from .logger import logger
+
+
+class DegradationController:
+    """
+    按聊天消息在事件队列中的等待时间（积压延迟）逐级降级消息解析
+
+    - 0 full: 完整解析
+    - 1 skip_image: 不下载图片/表情包，使用[图片]/[表情包]占位
+    - 2 skip_reply: 另外不展开引用的消息
+    - 3 cached_at: 另外@的昵称只从缓存中获取
+
+    延迟超过下一级的阈值时升一级；延迟回落到当前级阈值的一半以下，
+    且距上次切换已超过recover_interval秒时降一级，避免来回抖动
+    """
+
+    MODES = ("full", "skip_image", "skip_reply", "cached_at")
+
+    def __init__(self, lag_thresholds: List[int], recover_interval: float):
+        self.lag_thresholds = sorted(lag_thresholds)[: len(self.MODES) - 1]
+        self.recover_interval = recover_interval
+        self.level: int = 0
+        self.last_change: float = 0
+        self.mode_changes: Counter[str] = Counter()  # 进入每个模式的次数
+
+    @property
+    def mode(self) -> str:
+        return self.MODES[self.level]
+
+    @property
+    def skip_image(self) -> bool:
+        return self.level >= 1
+
+    @property
+    def skip_reply(self) -> bool:
+        return self.level >= 2
+
+    @property
+    def cached_at(self) -> bool:
+        return self.level >= 3
+
+    def observe(self, lag: float) -> None:
+        """
+        记录一条聊天消息出队时的等待时间（秒），必要时切换模式
+        """
+        now = time.monotonic()
+        if self.level < len(self.lag_thresholds) and lag > self.lag_thresholds[self.level]:
+            self._switch(self.level + 1, lag, now)
+        elif (
+            self.level > 0
+            and lag < self.lag_thresholds[self.level - 1] / 2
+            and now - self.last_change >= self.recover_interval
+        ):
+            self._switch(self.level - 1, lag, now)
+
+    def _switch(self, level: int, lag: float, now: float) -> None:
+        degrade = level > self.level
+        self.level = level
+        self.last_change = now
+        self.mode_changes[self.mode] += 1
+        if degrade:
+            logger.warning(f"消息积压延迟 {lag:.1f} 秒，解析降级为 {self.mode} 模式")
+        else:
+            logger.info(f"消息积压延迟回落至 {lag:.1f} 秒，解析恢复为 {self.mode} 模式")
+
+
+degradation_controller = DegradationController(
+    global_config.napcat_server.degrade_lag_thresholds, global_config.napcat_server.degrade_recover_interval
+)
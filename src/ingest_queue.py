@@ -0,0 +1,198 @@
+import time
+import asyncio
+from collections import Counter, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Literal, Tuple
+
+from .config import global_config
+from .degradation import degradation_controller
+from .logger import logger
+
+
+class IngestLane:
+    """
+    一个优先级通道，内部按会话分片
+
+    同一会话（群/私聊）的事件落在同一个分片中，分片同一时间只会被一个worker持有，
+    因此会话内保持顺序，不同会话之间可以并行处理。
+
+    max_size大于0时通道有容量上限，按shed_policy丢弃事件：
+    - drop_oldest: 通道已满时丢弃最早入队的事件
+    - drop_newest: 通道已满时丢弃新到达的事件
+    - max_age: 出队时丢弃等待超过max_age秒的事件，通道已满时丢弃新到达的事件
+    """
+
+    def __init__(
+        self,
+        name: str,
+        weight: int,
+        shard_count: int,
+        max_size: int = 0,
+        shed_policy: Literal["drop_oldest", "drop_newest", "max_age"] = "drop_newest",
+        max_age: float = 0,
+    ):
+        self.name = name
+        self.weight = max(1, weight)
+        self.shard_count = shard_count
+        self.max_size = max_size
+        self.shed_policy = shed_policy
+        self.max_age = max_age
+        self.shards: List[Deque[Tuple[float, dict]]] = [deque() for _ in range(shard_count)]  # (入队时间, 事件)
+        self.scheduled: List[bool] = [False] * shard_count  # 分片是否已在就绪队列中或正被处理
+        self.ready: Deque[int] = deque()  # 就绪的分片
+        self.current_weight: int = 0  # 平滑加权轮询使用
+        self.processed: int = 0
+        self.size: int = 0
+        self.shed_counts: Counter[Tuple] = Counter()  # 会话 -> 被丢弃的事件数
+
+    def qsize(self) -> int:
+        return self.size
+
+    def pop_oldest(self) -> Tuple[float, dict] | None:
+        """
+        移除通道中最早入队的事件
+        """
+        oldest_shard = None
+        for shard in self.shards:
+            if shard and (oldest_shard is None or shard[0][0] < oldest_shard[0][0]):
+                oldest_shard = shard
+        if oldest_shard is None:
+            return None
+        self.size -= 1
+        return oldest_shard.popleft()
+
+
+class IngestQueue:
+    """
+    带优先级通道的事件队列
+
+    事件按类型分为 meta（心跳/生命周期）、notice（通知）、message（聊天消息）三个通道，
+    worker按通道权重进行平滑加权轮询，高优先级通道不会被聊天消息淹没；
+    低优先级通道也总能按权重比例得到处理；最早的事件等待超过starvation_timeout的通道在轮询中权重加倍，
+    但不会越过其他通道直接被处理，聊天消息积压时心跳仍能及时处理
+    """
+
+    LANE_OF_POST_TYPE = {"meta_event": "meta", "notice": "notice"}
+
+    def __init__(self, shard_count: int):
+        self.shard_count = max(1, shard_count)
+        config = global_config.napcat_server
+        self.lanes: Dict[str, IngestLane] = {
+            "meta": IngestLane("meta", config.ingest_meta_weight, self.shard_count),
+            "notice": IngestLane("notice", config.ingest_notice_weight, self.shard_count),
+            "message": IngestLane(
+                "message",
+                config.ingest_message_weight,
+                self.shard_count,
+                max_size=config.ingest_max_size,
+                shed_policy=config.ingest_shed_policy,
+                max_age=config.ingest_max_age,
+            ),  # 只对聊天消息限流，meta事件与通知不丢弃
+        }
+        self.starvation_timeout: float = config.ingest_starvation_timeout
+        self._ready_count = asyncio.Semaphore(0)  # 所有通道中就绪分片的数量
+
+    @staticmethod
+    def conversation_key(message: dict) -> Tuple:
+        """
+        计算事件所属会话
+        """
+        if group_id := message.get("group_id"):
+            return ("group", group_id)
+        if user_id := message.get("user_id"):
+            return ("private", user_id)
+        return ("meta", message.get("self_id"))
+
+    def put(self, message: dict) -> None:
+        lane = self.lanes[self.LANE_OF_POST_TYPE.get(message.get("post_type"), "message")]
+        if lane.max_size > 0 and lane.size >= lane.max_size:
+            if lane.shed_policy == "drop_oldest":
+                _, dropped = lane.pop_oldest()
+                self._record_shed(lane, dropped, "通道已满，丢弃最早的事件")
+            else:
+                self._record_shed(lane, message, "通道已满，丢弃新事件")
+                return
+        shard = hash(self.conversation_key(message)) % self.shard_count
+        lane.shards[shard].append((time.monotonic(), message))
+        lane.size += 1
+        if not lane.scheduled[shard]:
+            lane.scheduled[shard] = True
+            self._mark_ready(lane, shard)
+
+    def _mark_ready(self, lane: IngestLane, shard: int) -> None:
+        lane.ready.append(shard)
+        self._ready_count.release()
+
+    def _record_shed(self, lane: IngestLane, message: dict, reason: str) -> None:
+        key = self.conversation_key(message)
+        lane.shed_counts[key] += 1
+        count = lane.shed_counts[key]
+        if count == 1 or count % 100 == 0:
+            logger.warning(f"{lane.name} 通道{reason}，会话 {key} 累计丢弃 {count} 条")
+
+    def shed_counts(self) -> Dict[str, Counter[Tuple]]:
+        """
+        各通道中按会话统计的被丢弃事件数
+        """
+        return {name: lane.shed_counts for name, lane in self.lanes.items() if lane.shed_counts}
+
+    def qsize(self) -> int:
+        return sum(lane.qsize() for lane in self.lanes.values())
+
+    def lane_depths(self) -> Dict[str, int]:
+        """
+        各通道中等待处理的事件数
+        """
+        return {name: lane.qsize() for name, lane in self.lanes.items()}
+
+    def _select_lane(self) -> IngestLane:
+        """
+        选择下一个要处理的通道，调用前保证至少有一个通道有就绪分片
+        """
+        candidates = [lane for lane in self.lanes.values() if lane.ready]
+        now = time.monotonic()
+        weights = {}
+        for lane in candidates:
+            head = lane.shards[lane.ready[0]]
+            # 按事件入队时间判断是否饥饿，饥饿的通道权重加倍
+            starving = bool(head) and now - head[0][0] > self.starvation_timeout
+            weights[lane.name] = lane.weight * 2 if starving else lane.weight
+        # 平滑加权轮询
+        total_weight = sum(weights.values())
+        for lane in candidates:
+            lane.current_weight += weights[lane.name]
+        lane = max(candidates, key=lambda item: item.current_weight)
+        lane.current_weight -= total_weight
+        return lane
+
+    async def worker(self, handler: Callable[[dict], Awaitable[None]]) -> None:
+        """
+        处理事件的worker，每次从选中通道的就绪分片中取出一条事件处理
+        """
+        while True:
+            await self._ready_count.acquire()
+            lane = self._select_lane()
+            shard = lane.ready.popleft()
+            if not lane.shards[shard]:
+                lane.scheduled[shard] = False  # 分片中的事件已全部被丢弃
+                continue
+            enqueue_time, message = lane.shards[shard].popleft()
+            lane.size -= 1
+            try:
+                wait_time = time.monotonic() - enqueue_time
+                if lane.shed_policy == "max_age" and wait_time > lane.max_age:
+                    self._record_shed(lane, message, f"事件等待超过 {lane.max_age} 秒，丢弃")
+                    continue
+                if lane.name == "message":
+                    degradation_controller.observe(wait_time)
+                await handler(message)
+            except Exception as e:
+                logger.exception(f"处理事件时出现错误: {e}")
+            finally:
+                lane.processed += 1
+                if lane.shards[shard]:
+                    self._mark_ready(lane, shard)  # 重新排队，让其他分片也有机会被处理
+                else:
+                    lane.scheduled[shard] = False
+
+
+ingest_queue = IngestQueue(global_config.napcat_server.ingest_shards)
@@ -0,0 +1,154 @@
+import os
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Set
+
+from .config import global_config
+from .database import async_db_manager, db_manager
+from .logger import logger
+
+MEDIA_CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "media_cache")
+
+
+class MediaCache:
+    """
+    基于内容寻址的本地媒体缓存
+
+    文件以内容的sha256命名存放在 data/media_cache 下，相同内容只保存一份；
+    QQ的文件ID/URL到内容哈希的映射保存在数据库中。
+    超出容量上限时按最近访问时间淘汰（以文件修改时间记录访问时间）
+    """
+
+    def __init__(self):
+        self.enabled: bool = global_config.media.cache_enabled
+        self.max_size: int = global_config.media.cache_max_size_mb * 1024 * 1024
+        self.key_index: Dict[str, str] = {}  # 缓存键 -> 内容哈希
+        self.hash_keys: Dict[str, Set[str]] = {}  # 内容哈希 -> 缓存键
+        self.blobs: OrderedDict[str, int] = OrderedDict()  # 内容哈希 -> 文件大小，按访问时间排序
+        self.total_size: int = 0
+        self._writing: Dict[str, asyncio.Task] = {}  # 正在写入的内容哈希，相同内容的并发写入只写一次
+        self.hits: int = 0
+        self.misses: int = 0
+        if self.enabled:
+            self._load_index()
+
+    def _load_index(self) -> None:
+        """
+        启动时加载缓存索引
+        """
+        os.makedirs(MEDIA_CACHE_DIR, exist_ok=True)
+        blob_files = []
+        for entry in os.scandir(MEDIA_CACHE_DIR):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                blob_files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, content_hash, size in sorted(blob_files):
+            self.blobs[content_hash] = size
+            self.total_size += size
+        for cache_key, content_hash in db_manager.get_media_cache_keys().items():
+            if content_hash in self.blobs:
+                self._add_key(cache_key, content_hash)
+        logger.info(f"媒体缓存已加载，共 {len(self.blobs)} 个文件，{self.total_size / 1024 / 1024:.1f} MB")
+
+    def _add_key(self, cache_key: str, content_hash: str) -> None:
+        if (old_hash := self.key_index.get(cache_key)) and old_hash != content_hash:
+            self.hash_keys[old_hash].discard(cache_key)
+        self.key_index[cache_key] = content_hash
+        self.hash_keys.setdefault(content_hash, set()).add(cache_key)
+
+    @staticmethod
+    def _blob_path(content_hash: str) -> str:
+        return os.path.join(MEDIA_CACHE_DIR, content_hash)
+
+    @staticmethod
+    def _read_blob(path: str) -> bytes:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)  # 记录访问时间
+        return data
+
+    @staticmethod
+    def _write_blob(path: str, data: bytes) -> None:
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    async def get(self, cache_key: str) -> bytes | None:
+        """
+        读取缓存，未命中时返回None
+        """
+        if not self.enabled:
+            return None
+        content_hash = self.key_index.get(cache_key)
+        if content_hash is None or content_hash not in self.blobs:
+            self.misses += 1
+            return None
+        try:
+            data = await asyncio.to_thread(self._read_blob, self._blob_path(content_hash))
+        except OSError as e:
+            logger.warning(f"读取媒体缓存失败: {e}")
+            self._drop_blob(content_hash)
+            self.misses += 1
+            return None
+        self.blobs.move_to_end(content_hash)
+        self.hits += 1
+        logger.trace(f"媒体缓存命中: {cache_key}，命中/未命中: {self.hits}/{self.misses}")
+        return data
+
+    async def put(self, cache_key: str, data: bytes) -> None:
+        """
+        写入缓存，相同内容只保存一份
+        """
+        if not self.enabled or len(data) > self.max_size:
+            return
+        content_hash = hashlib.sha256(data).hexdigest()
+        if content_hash not in self.blobs:
+            task = self._writing.get(content_hash)
+            if task is None:
+                task = asyncio.ensure_future(self._store_blob(content_hash, data))
+                self._writing[content_hash] = task
+                task.add_done_callback(lambda _: self._writing.pop(content_hash, None))
+            if not await asyncio.shield(task):
+                return
+        if content_hash not in self.blobs:
+            return  # 写入后立即被淘汰
+        self.blobs.move_to_end(content_hash)
+        if self.key_index.get(cache_key) != content_hash:
+            self._add_key(cache_key, content_hash)
+            async_db_manager.add_media_cache_key(cache_key, content_hash)
+        self._evict()
+
+    async def _store_blob(self, content_hash: str, data: bytes) -> bool:
+        """
+        写入文件并计入容量，返回是否成功
+        """
+        try:
+            await asyncio.to_thread(self._write_blob, self._blob_path(content_hash), data)
+        except OSError as e:
+            logger.warning(f"写入媒体缓存失败: {e}")
+            return False
+        if content_hash not in self.blobs:
+            self.blobs[content_hash] = len(data)
+            self.total_size += len(data)
+        return True
+
+    def _evict(self) -> None:
+        while self.total_size > self.max_size and self.blobs:
+            content_hash, _ = next(iter(self.blobs.items()))
+            logger.debug(f"媒体缓存超出容量上限，淘汰文件: {content_hash}")
+            self._drop_blob(content_hash)
+            try:
+                os.remove(self._blob_path(content_hash))
+            except OSError:
+                pass
+
+    def _drop_blob(self, content_hash: str) -> None:
+        self.total_size -= self.blobs.pop(content_hash, 0)
+        for cache_key in self.hash_keys.pop(content_hash, set()):
+            self.key_index.pop(cache_key, None)
+        async_db_manager.delete_media_cache_keys(content_hash)
+
+
+media_cache = MediaCache()
@@ -0,0 +1,58 @@
+"""
+定期在日志中输出运行指标，便于观察积压与降级情况
+"""
+
+import asyncio
+from typing import List
+
+from .circuit_breaker import circuit_breakers
+from .config import global_config
+from .ingest_queue import ingest_queue
+from .logger import logger
+from .napcat_client import napcat_client
+
+
+def collect_metrics() -> List[str]:
+    """
+    收集当前的运行指标，每项一行
+    """
+    lines: List[str] = []
+    depths = ingest_queue.lane_depths()
+    lines.append("事件队列积压: " + ", ".join(f"{name}={depth}" for name, depth in depths.items()))
+    for name, counts in ingest_queue.shed_counts().items():
+        top = ", ".join(f"{key}={count}" for key, count in counts.most_common(3))
+        lines.append(f"{name} 通道累计丢弃 {sum(counts.values())} 条，最多的会话: {top}")
+    if napcat_stats := napcat_client.stats():
+        lines.append(
+            "Napcat请求(调用/合并/重试): "
+            + ", ".join(
+                f"{action}={calls}/{collapsed}/{retried}"
+                for action, (calls, collapsed, retried) in sorted(napcat_stats.items())
+            )
+        )
+    tripped = {name: state for name, state in circuit_breakers.states().items() if state[1] > 0}
+    if tripped:
+        lines.append(
+            "熔断器: "
+            + ", ".join(
+                f"{name}={state}(打开 {open_count} 次, 拒绝 {rejected} 次)"
+                for name, (state, open_count, rejected) in tripped.items()
+            )
+        )
+    return lines
+
+
+async def report_metrics() -> None:
+    """
+    每隔metrics_interval秒输出一次运行指标，不大于0时不输出
+    """
+    interval = global_config.debug.metrics_interval
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            for line in collect_metrics():
+                logger.info(line)
+        except Exception as e:
+            logger.error(f"收集运行指标失败: {e}")
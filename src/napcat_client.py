@@ -0,0 +1,230 @@
+import time
+import uuid
+import asyncio
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Tuple, Union
+
+import websockets as Server
+
+from . import codec
+from .circuit_breaker import circuit_breakers
+from .config import global_config
+from .logger import logger
+from .response_pool import get_response, register_request
+
+# 当前事件的处理截止时间（time.monotonic），随上下文传递给事件处理中创建的所有任务
+_event_deadline: ContextVar[Optional[float]] = ContextVar("napcat_event_deadline", default=None)
+
+
+class NapcatClient:
+    """
+    Napcat客户端，所有发往Napcat的请求都经由此处
+
+    - 超时与重试次数按action配置，只读请求超时后重试，发送消息等有副作用的请求不会重试
+    - 处理同一个事件时的所有请求共享一个时间预算（见deadline），预算用完后请求直接超时
+    - 只读请求可以合并：同一连接上相同 (action, params) 的并发请求共享一次实际请求与其结果
+    - 只读请求按连接与action熔断：连续超时后直接失败（CircuitOpenError），由调用方走原有的降级逻辑
+    """
+
+    def __init__(self):
+        config = global_config.napcat_rpc
+        self.default_timeout: int = config.default_timeout
+        self.action_timeouts: Dict[str, int] = config.action_timeouts
+        self.default_retries: int = config.default_retries
+        self.action_retries: Dict[str, int] = config.action_retries
+        self.retry_delay: float = config.retry_delay
+        self.event_deadline: int = config.event_deadline
+        self.breaker_failure_threshold: int = config.breaker_failure_threshold
+        self.breaker_reset_timeout: int = config.breaker_reset_timeout
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls: Counter[str] = Counter()  # 每个action的调用次数
+        self.collapsed: Counter[str] = Counter()  # 每个action被合并的调用次数
+        self.retried: Counter[str] = Counter()  # 每个action的重试次数
+
+    @contextmanager
+    def deadline(self, seconds: Optional[float] = None) -> Iterator[None]:
+        """
+        为当前事件的处理设置时间预算，期间发出的所有请求共享该预算
+        Parameters:
+            seconds: 时间预算（秒），默认使用配置中的event_deadline，不大于0时不限制
+        """
+        if seconds is None:
+            seconds = self.event_deadline
+        token = _event_deadline.set(time.monotonic() + seconds if seconds > 0 else None)
+        try:
+            yield
+        finally:
+            _event_deadline.reset(token)
+
+    @staticmethod
+    def remaining_time() -> Optional[float]:
+        """
+        当前事件剩余的时间预算，未设置时返回None
+        """
+        deadline = _event_deadline.get()
+        return None if deadline is None else deadline - time.monotonic()
+
+    def _timeout_for(self, action: str) -> float:
+        timeout = self.action_timeouts.get(action, self.default_timeout)
+        remaining = self.remaining_time()
+        if remaining is None:
+            return timeout
+        if remaining <= 0:
+            raise TimeoutError(f"事件处理时间预算已用完，取消 {action} 请求")
+        return min(timeout, remaining)
+
+    @staticmethod
+    def _connection_label(websocket: Server.ServerConnection) -> str:
+        """
+        区分连接（账号）的标识，优先使用握手请求头中的X-Self-ID
+        """
+        request = getattr(websocket, "request", None)
+        self_id = request.headers.get("X-Self-ID") if request else None
+        return self_id or f"conn{id(websocket)}"
+
+    @staticmethod
+    def _request_key(websocket: Server.ServerConnection, action: str, params: Dict[str, Any]) -> Hashable:
+        try:
+            return (id(websocket), action, tuple(sorted(params.items())))
+        except TypeError:
+            return (id(websocket), action, codec.dumps(params))  # 参数中含有不可哈希的值
+
+    async def call(
+        self,
+        websocket: Server.ServerConnection,
+        action: str,
+        params: Dict[str, Any],
+        read_only: bool = True,
+    ) -> dict:
+        """
+        发送请求并返回Napcat的完整响应，合并的请求共享同一个响应对象，调用方不应修改它
+        Parameters:
+            read_only: 是否为只读请求，只有只读请求会被合并与重试
+        Raises:
+            TimeoutError: 等待响应超时（含重试）或事件处理时间预算已用完
+            CircuitOpenError: 该action已熔断
+        """
+        self.calls[action] += 1
+        retries = self.action_retries.get(action, self.default_retries) if read_only else 0
+        attempt = 0
+        while True:
+            try:
+                return await self._call_once(websocket, action, params, read_only)
+            except (TimeoutError, asyncio.TimeoutError):
+                remaining = self.remaining_time()
+                if attempt >= retries or (remaining is not None and remaining <= self.retry_delay):
+                    raise TimeoutError(f"{action} 请求超时") from None
+            attempt += 1
+            self.retried[action] += 1
+            logger.warning(f"{action} 请求超时，第 {attempt} 次重试")
+            await asyncio.sleep(self.retry_delay)
+
+    async def _call_once(
+        self, websocket: Server.ServerConnection, action: str, params: Dict[str, Any], read_only: bool
+    ) -> dict:
+        timeout = self._timeout_for(action)
+        if not read_only:
+            return await self._request(websocket, action, params, timeout)
+        key = self._request_key(websocket, action, params)
+        task = self._inflight.get(key)
+        if task is None:
+            breaker = circuit_breakers.get(
+                f"napcat:{self._connection_label(websocket)}:{action}",
+                self.breaker_failure_threshold,
+                self.breaker_reset_timeout,
+            )
+            # 因时间预算不足而缩短的超时不代表Napcat变慢，不计入熔断
+            full_timeout = timeout >= self.action_timeouts.get(action, self.default_timeout)
+            task = asyncio.ensure_future(
+                breaker.run(
+                    lambda: self._request(websocket, action, params, timeout),
+                    (TimeoutError, asyncio.TimeoutError),
+                    count_failure=full_timeout,
+                )
+            )
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: (self._inflight.pop(key, None), t.cancelled() or t.exception()))
+        else:
+            self.collapsed[action] += 1
+            logger.trace(f"合并相同的 {action} 请求，累计合并 {self.collapsed[action]} 次")
+        # 合并的请求各自按自己的时间预算等待
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+
+    @staticmethod
+    async def _request(
+        websocket: Server.ServerConnection, action: str, params: Dict[str, Any], timeout: float
+    ) -> dict:
+        request_uuid = str(uuid.uuid4())
+        payload = codec.dumps({"action": action, "params": params, "echo": request_uuid})
+        register_request(request_uuid)
+        await websocket.send(payload)
+        return await get_response(request_uuid, timeout)
+
+    def stats(self) -> Dict[str, Tuple[int, int, int]]:
+        """
+        每个action的 (调用次数, 被合并次数, 重试次数)
+        """
+        return {
+            action: (count, self.collapsed[action], self.retried[action]) for action, count in self.calls.items()
+        }
+
+    async def send_action(self, websocket: Server.ServerConnection, action: str, params: Dict[str, Any]) -> dict:
+        """
+        发送有副作用的请求（发送消息、执行命令等），不合并也不重试，返回完整响应
+        """
+        return await self.call(websocket, action, params, read_only=False)
+
+    async def get_group_info(self, websocket: Server.ServerConnection, group_id: int) -> Optional[dict]:
+        response = await self.call(websocket, "get_group_info", {"group_id": group_id})
+        return response.get("data")
+
+    async def get_group_detail_info(self, websocket: Server.ServerConnection, group_id: int) -> Optional[dict]:
+        response = await self.call(websocket, "get_group_detail_info", {"group_id": group_id})
+        return response.get("data")
+
+    async def get_group_member_info(
+        self, websocket: Server.ServerConnection, group_id: int, user_id: int, no_cache: bool = False
+    ) -> Optional[dict]:
+        response = await self.call(
+            websocket, "get_group_member_info", {"group_id": group_id, "user_id": user_id, "no_cache": no_cache}
+        )
+        return response.get("data")
+
+    async def get_group_member_list(
+        self, websocket: Server.ServerConnection, group_id: int, no_cache: bool = False
+    ) -> Optional[List[dict]]:
+        response = await self.call(websocket, "get_group_member_list", {"group_id": group_id, "no_cache": no_cache})
+        return response.get("data")
+
+    async def get_group_list(self, websocket: Server.ServerConnection) -> Optional[List[dict]]:
+        response = await self.call(websocket, "get_group_list", {})
+        return response.get("data")
+
+    async def get_login_info(self, websocket: Server.ServerConnection) -> Optional[dict]:
+        response = await self.call(websocket, "get_login_info", {})
+        return response.get("data")
+
+    async def get_stranger_info(self, websocket: Server.ServerConnection, user_id: int) -> Optional[dict]:
+        response = await self.call(websocket, "get_stranger_info", {"user_id": user_id})
+        return response.get("data")
+
+    async def get_msg(self, websocket: Server.ServerConnection, message_id: Union[str, int]) -> Optional[dict]:
+        response = await self.call(websocket, "get_msg", {"message_id": message_id})
+        return response.get("data")
+
+    async def get_record(
+        self, websocket: Server.ServerConnection, file: str, file_id: Optional[str] = None, out_format: str = "wav"
+    ) -> Optional[dict]:
+        response = await self.call(
+            websocket, "get_record", {"file": file, "file_id": file_id, "out_format": out_format}
+        )
+        return response.get("data")
+
+    async def get_forward_msg(self, websocket: Server.ServerConnection, message_id: str) -> Optional[dict]:
+        response = await self.call(websocket, "get_forward_msg", {"message_id": message_id})
+        return response.get("data")
+
+
+napcat_client = NapcatClient()
@@ -0,0 +1,104 @@
+import json
+import time
+from collections import OrderedDict
+from typing import List, Optional, Union
+
+from .config import global_config
+from .database import async_db_manager
+from .logger import logger
+
+
+class RecentMessageStore:
+    """
+    最近消息存储，用于在解析引用回复时避免向Napcat请求get_msg
+
+    内存中保留最近的消息（环形缓冲），被挤出的消息可选择写入数据库
+    """
+
+    PRUNE_INTERVAL = 500  # 每写入多少条溢出消息清理一次过期记录
+
+    def __init__(self):
+        self.max_size: int = global_config.cache.recent_message_size
+        self.spill: bool = global_config.cache.recent_message_spill
+        self._messages: OrderedDict[str, dict] = OrderedDict()
+        self._spill_count: int = 0
+
+    def put(self, message: dict) -> None:
+        """
+        存入一条消息，格式与get_msg的返回值一致
+        """
+        message_id = message.get("message_id")
+        if message_id is None:
+            return
+        key = str(message_id)
+        self._messages[key] = message
+        self._messages.move_to_end(key)
+        while len(self._messages) > self.max_size:
+            evicted_id, evicted_message = self._messages.popitem(last=False)
+            if self.spill:
+                self._spill(evicted_id, evicted_message)
+
+    def put_sent(
+        self,
+        message_id: Union[str, int],
+        sent_message: List[dict],
+        self_info: dict,
+        group_id: Optional[int] = None,
+    ) -> None:
+        """
+        存入一条自身发送的消息
+        Parameters:
+            message_id: QQ消息ID
+            sent_message: 发送给Napcat的消息段列表
+            self_info: 自身信息
+            group_id: 群号，私聊时为空
+        """
+        message: List[dict] = []
+        for seg in sent_message:
+            match seg.get("type"):
+                case "text" | "face" | "at":
+                    message.append(seg)
+                case "image":
+                    # 不保存base64数据，避免占用过多内存
+                    placeholder = "[表情包]" if seg.get("data", {}).get("subtype") == 1 else "[图片]"
+                    message.append({"type": "text", "data": {"text": placeholder}})
+                case "record":
+                    message.append({"type": "text", "data": {"text": "[语音]"}})
+        if not message:
+            return
+        self.put(
+            {
+                "message_id": message_id,
+                "message_type": "group" if group_id else "private",
+                "group_id": group_id,
+                "self_id": self_info.get("user_id"),
+                "user_id": self_info.get("user_id"),
+                "time": int(time.time()),
+                "sender": {"user_id": self_info.get("user_id"), "nickname": self_info.get("nickname")},
+                "message": message,
+            }
+        )
+
+    async def get(self, message_id: Union[str, int]) -> dict | None:
+        """
+        获取消息，未找到时返回None
+        """
+        key = str(message_id)
+        if message := self._messages.get(key):
+            logger.debug(f"从最近消息中找到消息: {key}")
+            return message
+        if self.spill:
+            if content := await async_db_manager.get_recent_message(key):
+                logger.debug(f"从数据库中找到最近消息: {key}")
+                return json.loads(content)
+        return None
+
+    def _spill(self, message_id: str, message: dict) -> None:
+        async_db_manager.save_recent_message(message_id, json.dumps(message, ensure_ascii=False), int(time.time()))
+        self._spill_count += 1
+        if self._spill_count % self.PRUNE_INTERVAL == 0:
+            expire_time = int(time.time()) - global_config.cache.recent_message_spill_ttl
+            async_db_manager.prune_recent_messages(expire_time)
+
+
+recent_message_store = RecentMessageStore()
@@ -0,0 +1,88 @@
+import time
+import heapq
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from src.logger import logger
+from src.database import BanUser
+
+
+class BanScheduler:
+    """
+    禁言到期调度器
+
+    使用 (group_id, user_id) 为键的字典保存仍在禁言中的记录，
+    并用按lift_time排序的最小堆安排到期时间，仅在最近的到期时间唤醒
+    """
+
+    def __init__(self):
+        self.banned: Dict[Tuple[int, int], BanUser] = {}  # 当前仍在禁言中的记录
+        self.lifted_queue: asyncio.Queue[BanUser] = asyncio.Queue()  # 已经自然解除禁言的记录
+        self._heap: List[Tuple[int, int, int]] = []  # (lift_time, group_id, user_id)，已失效的项在弹出时跳过
+        self._wakeup = asyncio.Event()
+
+    def load(self, banned_list: List[BanUser], lifted_list: List[BanUser]) -> None:
+        """
+        载入禁言列表，替换当前状态
+        """
+        self.banned = {(record.group_id, record.user_id): record for record in banned_list}
+        self._heap = [
+            (record.lift_time, record.group_id, record.user_id)
+            for record in banned_list
+            if self._is_schedulable(record)
+        ]
+        heapq.heapify(self._heap)
+        for record in lifted_list:
+            self.lifted_queue.put_nowait(record)
+        self._wakeup.set()
+
+    @staticmethod
+    def _is_schedulable(record: BanUser) -> bool:
+        # 全体禁言没有到期时间
+        return record.user_id != 0 and record.lift_time is not None and record.lift_time > 0
+
+    def ban(self, record: BanUser) -> None:
+        """
+        添加或更新禁言记录
+        """
+        self.banned[(record.group_id, record.user_id)] = record
+        if not self._is_schedulable(record):
+            return
+        heapq.heappush(self._heap, (record.lift_time, record.group_id, record.user_id))
+        if self._heap[0][0] == record.lift_time:
+            self._wakeup.set()  # 新的到期时间更早，重新计算等待时间
+        if len(self._heap) > 2 * len(self.banned) + 64:
+            self._compact()
+
+    def lift(self, group_id: int, user_id: int) -> Optional[BanUser]:
+        """
+        移除禁言记录（例如被手动解除），返回被移除的记录
+        """
+        return self.banned.pop((group_id, user_id), None)
+
+    def _compact(self) -> None:
+        """
+        清除堆中已失效的项
+        """
+        self._heap = [
+            item for item in self._heap if (record := self.banned.get(item[1:])) and record.lift_time == item[0]
+        ]
+        heapq.heapify(self._heap)
+
+    async def run(self) -> None:
+        while True:
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                lift_time, group_id, user_id = heapq.heappop(self._heap)
+                record = self.banned.get((group_id, user_id))
+                if record is None or record.lift_time != lift_time:
+                    continue  # 已被解除或更新
+                del self.banned[(group_id, user_id)]
+                logger.info(f"检测到用户 {user_id} 在群 {group_id} 的禁言已解除")
+                self.lifted_queue.put_nowait(record)
+            self._wakeup.clear()
+            timeout = max(self._heap[0][0] - time.time(), 0) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
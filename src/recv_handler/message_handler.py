@@ -1,5 +1,9 @@
 from src.logger import logger
+from src import codec
 from src.config import global_config
+from src.database import BotVerdict, async_db_manager, db_manager
+from src.degradation import degradation_controller
+from src.recent_message_store import recent_message_store
 from src.utils import (
     get_group_info,
     get_member_info,
@@ -13,10 +17,9 @@ from .message_sending import message_send_instance
 from . import RealMessageType, MessageType, ACCEPT_FORMAT
 
 import time
-import json
+import asyncio
 import websockets as Server
 from typing import List, Tuple, Optional, Dict, Any
-import uuid
 
 from maim_message import (
     UserInfo,
@@ -29,13 +32,19 @@ from maim_message import (
 )
 
 
-from src.response_pool import get_response
+from src.napcat_client import napcat_client
+
+
+# QQ官方机器人判定结果与账号无关，所有连接共享
+bot_verdicts: Dict[int, BotVerdict] = {verdict.user_id: verdict for verdict in db_manager.get_bot_verdicts()}
+refreshing_bot_ids: set[int] = set()  # 正在后台重新判定的用户
 
 
 class MessageHandler:
     def __init__(self):
         self.server_connection: Server.ServerConnection = None
-        self.bot_id_list: Dict[int, bool] = {}
+        self.bot_id_list: Dict[int, BotVerdict] = bot_verdicts
+        self._refreshing_bot_ids: set[int] = refreshing_bot_ids
 
     async def set_server_connection(self, server_connection: Server.ServerConnection) -> None:
         """设置Napcat连接"""
@@ -80,22 +89,43 @@ class MessageHandler:
             return False
 
         if global_config.chat.ban_qq_bot and group_id and not ignore_bot:
-            logger.debug("开始判断是否为机器人")
-            member_info = await get_member_info(self.server_connection, group_id, user_id)
-            if member_info:
-                is_bot = member_info.get("is_robot")
-                if is_bot is None:
-                    logger.warning("无法获取用户是否为机器人，默认为不是但是不进行更新")
-                else:
-                    if is_bot:
-                        logger.warning("QQ官方机器人消息拦截已启用，消息被丢弃，新机器人加入拦截名单")
-                        self.bot_id_list[user_id] = True
-                        return False
-                    else:
-                        self.bot_id_list[user_id] = False
+            verdict = self.bot_id_list.get(user_id)
+            if verdict is None:
+                verdict = await self._check_qq_bot(group_id, user_id)
+            elif time.time() - verdict.check_time > global_config.cache.bot_verdict_ttl:
+                if user_id not in self._refreshing_bot_ids:
+                    self._refreshing_bot_ids.add(user_id)
+                    asyncio.create_task(self._check_qq_bot(group_id, user_id))
+            if verdict and verdict.is_bot:
+                logger.warning("QQ官方机器人消息拦截已启用，消息被丢弃")
+                return False
 
         return True
 
+    async def _check_qq_bot(self, group_id: int, user_id: int) -> BotVerdict | None:
+        """
+        向Napcat查询用户是否为QQ官方机器人，并持久化判定结果
+        Returns:
+            BotVerdict | None: 判定结果，无法判定时为None
+        """
+        logger.debug("开始判断是否为机器人")
+        try:
+            member_info = await get_member_info(self.server_connection, group_id, user_id)
+            if not member_info:
+                return None
+            is_bot = member_info.get("is_robot")
+            if is_bot is None:
+                logger.warning("无法获取用户是否为机器人，默认为不是但是不进行更新")
+                return None
+            if is_bot and not (user_id in self.bot_id_list and self.bot_id_list[user_id].is_bot):
+                logger.warning("检测到新的QQ官方机器人，加入拦截名单")
+            verdict = BotVerdict(user_id=user_id, is_bot=bool(is_bot), check_time=int(time.time()))
+            self.bot_id_list[user_id] = verdict
+            async_db_manager.update_bot_verdict(verdict)
+            return verdict
+        finally:
+            self._refreshing_bot_ids.discard(user_id)
+
     async def handle_raw_message(self, raw_message: dict) -> None:
         # sourcery skip: low-code-quality, remove-unreachable-code
         """
@@ -209,6 +239,7 @@ class MessageHandler:
         if not raw_message.get("message"):
             logger.warning("原始消息内容为空")
             return None
+        recent_message_store.put(raw_message)
 
         # 获取Seg列表
         seg_message, additional_config = await self.handle_real_message(raw_message)
@@ -248,9 +279,10 @@ class MessageHandler:
     async def handle_real_message(
         self, raw_message: dict, in_reply: bool = False
     ) -> Tuple[List[Seg] | None, Dict[str, Any]]:
-        # sourcery skip: low-code-quality
         """
         处理实际消息
+
+        各消息段并发解析（并发数受限），结果按原顺序拼接
         Parameters:
             real_message: dict: 实际消息
         Returns:
@@ -261,81 +293,98 @@ class MessageHandler:
         if not real_message:
             logger.warning("实际消息内容为空")
             return None, {}
-        seg_message: List[Seg] = []
+
         for sub_message in real_message:
-            sub_message: dict
-            sub_message_type = sub_message.get("type")
-            match sub_message_type:
-                case RealMessageType.text:
-                    ret_seg = await self.handle_text_message(sub_message)
-                    if ret_seg:
-                        seg_message.append(ret_seg)
-                    else:
-                        logger.warning("text处理失败")
-                case RealMessageType.face:
-                    ret_seg = await self.handle_face_message(sub_message)
-                    if ret_seg:
-                        seg_message.append(ret_seg)
-                    else:
-                        logger.warning("face处理失败或不支持")
-                case RealMessageType.reply:
-                    if not in_reply:
-                        ret_seg, additional_config = await self.handle_reply_message(sub_message, additional_config)
-                        if ret_seg:
-                            seg_message += ret_seg
-                        else:
-                            logger.warning("reply处理失败")
-                case RealMessageType.image:
-                    ret_seg = await self.handle_image_message(sub_message)
-                    if ret_seg:
-                        seg_message.append(ret_seg)
-                    else:
-                        logger.warning("image处理失败")
-                case RealMessageType.record:
-                    ret_seg = await self.handle_record_message(sub_message)
-                    if ret_seg:
-                        seg_message.clear()
-                        seg_message.append(ret_seg)
-                        break  # 使得消息只有record消息
-                    else:
-                        logger.warning("record处理失败或不支持")
-                case RealMessageType.video:
-                    logger.warning("不支持视频解析")
-                case RealMessageType.at:
-                    ret_seg = await self.handle_at_message(
-                        sub_message,
-                        raw_message.get("self_id"),
-                        raw_message.get("group_id"),
-                    )
-                    if ret_seg:
-                        seg_message.append(ret_seg)
-                    else:
-                        logger.warning("at处理失败")
-                case RealMessageType.rps:
-                    logger.warning("暂时不支持猜拳魔法表情解析")
-                case RealMessageType.dice:
-                    logger.warning("暂时不支持骰子表情解析")
-                case RealMessageType.shake:
-                    # 预计等价于戳一戳
-                    logger.warning("暂时不支持窗口抖动解析")
-                case RealMessageType.share:
-                    logger.warning("暂时不支持链接解析")
-                case RealMessageType.forward:
-                    messages = await self._get_forward_message(sub_message)
-                    if not messages:
-                        logger.warning("转发消息内容为空或获取失败")
-                        return None, {}
-                    ret_seg = await self.handle_forward_message(messages)
-                    if ret_seg:
-                        seg_message.append(ret_seg)
-                    else:
-                        logger.warning("转发消息处理失败")
-                case RealMessageType.node:
-                    logger.warning("不支持转发消息节点解析")
-                case _:
-                    logger.warning(f"未知消息类型: {sub_message_type}")
+            if sub_message.get("type") == RealMessageType.record:
+                ret_seg = await self.handle_record_message(sub_message)
+                if ret_seg:
+                    return [ret_seg], additional_config  # 使得消息只有record消息
+                logger.warning("record处理失败或不支持")
+
+        semaphore = asyncio.Semaphore(global_config.media.max_concurrent_fetches)
+
+        async def handle_with_limit(sub_message: dict) -> List[Seg] | None:
+            async with semaphore:
+                return await self._handle_sub_message(sub_message, raw_message, additional_config, in_reply)
+
+        results = await asyncio.gather(*(handle_with_limit(sub_message) for sub_message in real_message))
+        seg_message: List[Seg] = []
+        for ret_segs in results:
+            if ret_segs is None:
+                return None, {}
+            seg_message += ret_segs
         return seg_message, additional_config
 
+    async def _handle_sub_message(
+        self, sub_message: dict, raw_message: dict, additional_config: dict, in_reply: bool
+    ) -> List[Seg] | None:
+        # sourcery skip: low-code-quality
+        """
+        处理单个消息段
+        Returns:
+            list[Seg]: 处理后的消息段（处理失败或不支持时为空列表）
+            None: 整条消息无法处理
+        """
+        sub_message_type = sub_message.get("type")
+        match sub_message_type:
+            case RealMessageType.text:
+                ret_seg = await self.handle_text_message(sub_message)
+                if ret_seg:
+                    return [ret_seg]
+                logger.warning("text处理失败")
+            case RealMessageType.face:
+                ret_seg = await self.handle_face_message(sub_message)
+                if ret_seg:
+                    return [ret_seg]
+                logger.warning("face处理失败或不支持")
+            case RealMessageType.reply:
+                if not in_reply:
+                    ret_segs, _ = await self.handle_reply_message(sub_message, additional_config)
+                    if ret_segs:
+                        return ret_segs
+                    logger.warning("reply处理失败")
+            case RealMessageType.image:
+                ret_seg = await self.handle_image_message(sub_message)
+                if ret_seg:
+                    return [ret_seg]
+                logger.warning("image处理失败")
+            case RealMessageType.record:
+                pass  # 语音消息已单独处理
+            case RealMessageType.video:
+                logger.warning("不支持视频解析")
+            case RealMessageType.at:
+                ret_seg = await self.handle_at_message(
+                    sub_message,
+                    raw_message.get("self_id"),
+                    raw_message.get("group_id"),
+                )
+                if ret_seg:
+                    return [ret_seg]
+                logger.warning("at处理失败")
+            case RealMessageType.rps:
+                logger.warning("暂时不支持猜拳魔法表情解析")
+            case RealMessageType.dice:
+                logger.warning("暂时不支持骰子表情解析")
+            case RealMessageType.shake:
+                # 预计等价于戳一戳
+                logger.warning("暂时不支持窗口抖动解析")
+            case RealMessageType.share:
+                logger.warning("暂时不支持链接解析")
+            case RealMessageType.forward:
+                messages = await self._get_forward_message(sub_message)
+                if not messages:
+                    logger.warning("转发消息内容为空或获取失败")
+                    return None
+                ret_seg = await self.handle_forward_message(messages)
+                if ret_seg:
+                    return [ret_seg]
+                logger.warning("转发消息处理失败")
+            case RealMessageType.node:
+                logger.warning("不支持转发消息节点解析")
+            case _:
+                logger.warning(f"未知消息类型: {sub_message_type}")
+        return []
+
     async def handle_text_message(self, raw_message: dict) -> Seg:
         """
         处理纯文本信息
@@ -375,11 +424,13 @@ class MessageHandler:
         """
         message_data: dict = raw_message.get("data")
         image_sub_type = message_data.get("sub_type")
+        if degradation_controller.skip_image:
+            return Seg(type="text", data="[图片]" if image_sub_type == 0 else "[表情包]")
         try:
-            image_base64 = await get_image_base64(message_data.get("url"))
+            image_base64 = await get_image_base64(message_data.get("url"), message_data.get("file"))
         except Exception as e:
             logger.error(f"图片消息处理失败: {str(e)}")
-            return None
+            return Seg(type="text", data="[图片]" if image_sub_type == 0 else "[表情包]")
         if image_sub_type == 0:
             """这部分认为是图片"""
             return Seg(type="image", data=image_base64)
@@ -404,19 +455,22 @@ class MessageHandler:
         message_data: dict = raw_message.get("data")
         if message_data:
             qq_id = message_data.get("qq")
+            cache_only = degradation_controller.cached_at
             if str(self_id) == str(qq_id):
                 logger.debug("机器人被at")
-                self_info: dict = await get_self_info(self.server_connection)
+                self_info: dict = await get_self_info(self.server_connection, cache_only=cache_only)
                 if self_info:
                     return Seg(type="text", data=f"@<{self_info.get('nickname')}:{self_info.get('user_id')}>")
-                else:
-                    return None
             else:
-                member_info: dict = await get_member_info(self.server_connection, group_id=group_id, user_id=qq_id)
+                member_info: dict = await get_member_info(
+                    self.server_connection, group_id=group_id, user_id=qq_id, cache_only=cache_only
+                )
                 if member_info:
                     return Seg(type="text", data=f"@<{member_info.get('nickname')}:{member_info.get('user_id')}>")
-                else:
-                    return None
+            if cache_only:
+                # 缓存未命中时不再请求Napcat，使用消息中附带的名称
+                return Seg(type="text", data=f"@<{message_data.get('name') or qq_id}:{qq_id}>")
+            return None
 
     async def handle_record_message(self, raw_message: dict) -> Seg | None:
         """
@@ -458,14 +512,23 @@ class MessageHandler:
         else:
             return None, {}
         additional_config["reply_message_id"] = message_id
-        message_detail: dict = await get_message_detail(self.server_connection, message_id)
+        if degradation_controller.skip_reply:
+            return [Seg(type="text", data="[回复一条消息]，说：")], additional_config
+        reply_message: List[Seg] | None = None
+        message_detail: dict = await recent_message_store.get(message_id)
         if not message_detail:
-            logger.warning("获取被引用的消息详情失败")
-            return None, {}
-        reply_message, _ = await self.handle_real_message(message_detail, in_reply=True)
+            message_detail = await get_message_detail(self.server_connection, message_id)
+            if message_detail:
+                recent_message_store.put(message_detail)
+            else:
+                # 获取失败（超时或熔断）时仍保留引用的结构，只是内容未知
+                logger.warning("获取被引用的消息详情失败")
+                message_detail = {}
+        if message_detail:
+            reply_message, _ = await self.handle_real_message(message_detail, in_reply=True)
         if reply_message is None:
-            reply_message = "(获取发言内容失败)"
-        sender_info: dict = message_detail.get("sender")
+            reply_message = [Seg(type="text", data="(获取发言内容失败)")]
+        sender_info: dict = message_detail.get("sender") or {}
         sender_nickname: str = sender_info.get("nickname")
         sender_id: str = sender_info.get("user_id")
         seg_message: List[Seg] = []
@@ -484,15 +547,17 @@ class MessageHandler:
         Parameters:
             message_list: list: 转发消息列表
         """
-        handled_message, image_count = await self._handle_forward_message(message_list, 0)
+        cache_keys: Dict[str, str] = {}
+        handled_message, image_count = await self._handle_forward_message(message_list, 0, cache_keys)
         handled_message: Seg
         image_count: int
         if not handled_message:
             return None
-        if image_count < 5 and image_count > 0:
+        if image_count < 5 and image_count > 0 and not degradation_controller.skip_image:
             # 处理图片数量小于5的情况，此时解析图片为base64
             logger.trace("图片数量小于5，开始解析图片为base64")
-            return await self._recursive_parse_image_seg(handled_message, True)
+            semaphore = asyncio.Semaphore(global_config.media.max_concurrent_fetches)
+            return await self._recursive_parse_image_seg(handled_message, True, semaphore, cache_keys)
         elif image_count > 0:
             logger.trace("图片数量大于等于5，开始解析图片为占位符")
             # 处理图片数量大于等于5的情况，此时解析图片为占位符
@@ -502,19 +567,33 @@ class MessageHandler:
             logger.trace("没有图片，直接返回")
             return handled_message
 
-    async def _recursive_parse_image_seg(self, seg_data: Seg, to_image: bool) -> Seg:
+    async def _recursive_parse_image_seg(
+        self,
+        seg_data: Seg,
+        to_image: bool,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        cache_keys: Optional[Dict[str, str]] = None,
+    ) -> Seg:
         # sourcery skip: merge-else-if-into-elif
+        """
+        递归解析转发消息中的图片，to_image为True时并发下载各图片（并发数由semaphore限制）
+        cache_keys为图片URL到文件ID的映射，URL中的rkey每次获取都会变化，需要按文件ID读写媒体缓存
+        """
+        cache_keys = cache_keys or {}
         if to_image:
             if seg_data.type == "seglist":
-                new_seg_list = []
-                for i_seg in seg_data.data:
-                    parsed_seg = await self._recursive_parse_image_seg(i_seg, to_image)
-                    new_seg_list.append(parsed_seg)
-                return Seg(type="seglist", data=new_seg_list)
+                new_seg_list = await asyncio.gather(
+                    *(
+                        self._recursive_parse_image_seg(i_seg, to_image, semaphore, cache_keys)
+                        for i_seg in seg_data.data
+                    )
+                )
+                return Seg(type="seglist", data=list(new_seg_list))
             elif seg_data.type == "image":
                 image_url = seg_data.data
                 try:
-                    encoded_image = await get_image_base64(image_url)
+                    async with semaphore:
+                        encoded_image = await get_image_base64(image_url, cache_keys.get(image_url))
                 except Exception as e:
                     logger.error(f"图片处理失败: {str(e)}")
                     return Seg(type="text", data="[图片]")
@@ -522,7 +601,8 @@ class MessageHandler:
             elif seg_data.type == "emoji":
                 image_url = seg_data.data
                 try:
-                    encoded_image = await get_image_base64(image_url)
+                    async with semaphore:
+                        encoded_image = await get_image_base64(image_url, cache_keys.get(image_url))
                 except Exception as e:
                     logger.error(f"图片处理失败: {str(e)}")
                     return Seg(type="text", data="[表情包]")
@@ -545,13 +625,16 @@ class MessageHandler:
                 logger.trace(f"不处理类型: {seg_data.type}")
                 return seg_data
 
-    async def _handle_forward_message(self, message_list: list, layer: int) -> Tuple[Seg, int] | Tuple[None, int]:
+    async def _handle_forward_message(
+        self, message_list: list, layer: int, cache_keys: Dict[str, str]
+    ) -> Tuple[Seg, int] | Tuple[None, int]:
         # sourcery skip: low-code-quality
         """
         递归处理实际转发消息
         Parameters:
             message_list: list: 转发消息列表，首层对应messages字段，后面对应content字段
             layer: int: 当前层级
+            cache_keys: Dict[str, str]: 收集图片URL到文件ID的映射，用作媒体缓存的键
         Returns:
             seg_data: Seg: 处理后的消息段
             image_count: int: 图片数量
@@ -582,7 +665,7 @@ class MessageHandler:
                     if not sub_message_data:
                         continue
                     contents = sub_message_data.get("content")
-                    seg_data, count = await self._handle_forward_message(contents, layer + 1)
+                    seg_data, count = await self._handle_forward_message(contents, layer + 1, cache_keys)
                     image_count += count
                     head_tip = Seg(
                         type="text",
@@ -615,6 +698,8 @@ class MessageHandler:
                 image_data = message_of_sub_message.get("data")
                 sub_type = image_data.get("sub_type")
                 image_url = image_data.get("url")
+                if image_file := image_data.get("file"):
+                    cache_keys[image_url] = image_file
                 data_list: List[Any] = []
                 if sub_type == 0:
                     seg_data = Seg(type="image", data=image_url)
@@ -642,33 +727,21 @@ class MessageHandler:
             logger.warning("转发消息内容为空")
             return None
         forward_message_id = forward_message_data.get("id")
-        request_uuid = str(uuid.uuid4())
-        payload = json.dumps(
-            {
-                "action": "get_forward_msg",
-                "params": {"message_id": forward_message_id},
-                "echo": request_uuid,
-            }
-        )
         try:
-            await self.server_connection.send(payload)
-            response: dict = await get_response(request_uuid)
+            response_data: Dict = await napcat_client.get_forward_msg(self.server_connection, forward_message_id)
         except TimeoutError:
             logger.error("获取转发消息超时")
             return None
         except Exception as e:
             logger.error(f"获取转发消息失败: {str(e)}")
             return None
-        logger.debug(
-            f"转发消息原始格式：{json.dumps(response)[:80]}..."
-            if len(json.dumps(response)) > 80
-            else json.dumps(response)
+        # 转发消息可能很大，仅在输出debug日志时序列化一次
+        logger.opt(lazy=True).debug(
+            "转发消息原始格式：{}",
+            lambda: text if len(text := codec.dumps(response_data)) <= 80 else f"{text[:80]}...",
         )
-        response_data: Dict = response.get("data")
         if not response_data:
             logger.warning("转发消息内容为空或获取失败")
             return None
         return response_data.get("messages")
 
-
-message_handler = MessageHandler()
@@ -1,7 +1,11 @@
+import asyncio
 from typing import Dict
 from src.logger import logger
+from src.config import global_config
 from maim_message import MessageBase, Router
 
+from .message_spool import MessageSpool
+
 
 class MessageSending:
     """
@@ -11,23 +15,70 @@ class MessageSending:
     maibot_router: Router = None
 
     def __init__(self):
-        pass
+        self.spool: MessageSpool = MessageSpool()  # 与麦麦断开期间的消息缓冲
+        self._replay_task: asyncio.Task = None
+
+    async def _send(self, message_base: MessageBase) -> bool:
+        send_status = await self.maibot_router.send_message(message_base)
+        if not send_status:
+            raise RuntimeError("可能是路由未正确配置或连接异常")
+        return send_status
 
-    async def message_send(self, message_base: MessageBase) -> bool:
+    async def message_send(self, message_base: MessageBase, spool: bool = True) -> bool:
         """
         发送消息
         Parameters:
             message_base: MessageBase: 消息基类，包含发送目标和消息内容等信息
+            spool: bool: 发送失败时是否放入缓冲区，在与麦麦重新连接后按顺序补发
+        Returns:
+            bool: 是否已立即发送成功，放入缓冲区时返回False
         """
+        if spool and self.spool:
+            # 缓冲区中还有未补发的消息，排在其后以保持顺序
+            self._put_spool(message_base)
+            return False
         try:
-            send_status = await self.maibot_router.send_message(message_base)
-            if not send_status:
-                raise RuntimeError("可能是路由未正确配置或连接异常")
-            return send_status
+            return await self._send(message_base)
         except Exception as e:
             logger.error(f"发送消息失败: {str(e)}")
-            logger.error("请检查与MaiBot之间的连接")
-        
+            if not spool:
+                logger.error("请检查与MaiBot之间的连接")
+                return False
+            logger.warning("与MaiBot的连接异常，消息已放入缓冲区，将在重新连接后补发")
+            self._put_spool(message_base)
+            return False
+
+    def _put_spool(self, message_base: MessageBase) -> None:
+        self.spool.put(message_base.to_dict())
+        if self._replay_task is None or self._replay_task.done():
+            self._replay_task = asyncio.create_task(self._replay())
+
+    async def _replay(self) -> None:
+        """
+        按顺序补发缓冲区中的消息，发送失败时等待后重试，直到缓冲区清空
+        """
+        retry_interval = global_config.maibot_server.spool_retry_interval
+        while (message := await self.spool.peek()) is not None:
+            try:
+                await self._send(MessageBase.from_dict(message))
+            except Exception as e:
+                logger.debug(f"补发缓冲消息失败，{retry_interval} 秒后重试，当前缓冲 {self.spool.depth()} 条: {e}")
+                await asyncio.sleep(retry_interval)
+                continue
+            self.spool.pop()
+            if not self.spool:
+                logger.info(
+                    f"缓冲消息已全部补发，累计补发 {self.spool.replayed} 条，"
+                    f"超时丢弃 {self.spool.dropped_expired} 条，溢出丢弃 {self.spool.dropped_overflow} 条"
+                )
+
+    def start_replay(self) -> None:
+        """
+        启动时补发上次运行留在磁盘中的消息
+        """
+        if self.spool and (self._replay_task is None or self._replay_task.done()):
+            self._replay_task = asyncio.create_task(self._replay())
+
     async def send_custom_message(self, custom_message: Dict, platform: str, message_type: str) -> bool:
         """
         发送自定义消息
@@ -0,0 +1,172 @@
+import os
+import time
+import json
+import asyncio
+from collections import deque
+from typing import Deque, List, Tuple
+
+from src.logger import logger
+from src.config import global_config
+
+SPOOL_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data", "maibot_spool")
+
+SpoolItem = Tuple[float, dict]  # (入队时间, MessageBase.to_dict())
+
+
+class SpoolSegment:
+    """
+    溢出到磁盘的一段消息
+    """
+
+    def __init__(self, path: str, count: int, write_task: asyncio.Task | None = None):
+        self.path = path
+        self.count = count
+        self.write_task = write_task  # 写入完成前不能读取
+
+
+class MessageSpool:
+    """
+    麦麦断开连接期间待发送消息的缓冲区
+
+    消息按入队顺序保存：内存头部 -> 磁盘分段 -> 内存尾部。
+    未启用磁盘溢出时只使用内存头部，超出容量的新消息被丢弃；
+    启用后，头部满了的消息先进入尾部，尾部攒够一段后写入磁盘，头部取空时再按顺序读回
+    """
+
+    SEGMENT_SIZE = 500  # 每个磁盘分段的消息数
+
+    def __init__(self):
+        self.max_size: int = global_config.maibot_server.spool_max_size
+        self.disk_overflow: bool = global_config.maibot_server.spool_disk_overflow
+        self.disk_max_size: int = global_config.maibot_server.spool_disk_max_size
+        self.max_age: float = global_config.maibot_server.spool_max_age
+        self._head: Deque[SpoolItem] = deque()
+        self._segments: Deque[SpoolSegment] = deque()
+        self._tail: List[SpoolItem] = []
+        self._disk_count: int = 0
+        self._segment_seq: int = 0
+        self.dropped_expired: int = 0  # 因超时被丢弃的消息数
+        self.dropped_overflow: int = 0  # 因缓冲区已满被丢弃的消息数
+        self.replayed: int = 0  # 重新发送成功的消息数
+        if self.disk_overflow:
+            self._load_segments()
+
+    def depth(self) -> int:
+        return len(self._head) + self._disk_count + len(self._tail)
+
+    def __bool__(self) -> bool:
+        return self.depth() > 0
+
+    def _load_segments(self) -> None:
+        """
+        载入上次运行时留在磁盘上的消息
+        """
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        for name in sorted(os.listdir(SPOOL_DIR)):
+            if not name.endswith(".jsonl"):
+                continue
+            path = os.path.join(SPOOL_DIR, name)
+            with open(path, "r", encoding="utf-8") as f:
+                count = sum(1 for _ in f)
+            self._segments.append(SpoolSegment(path, count))
+            self._disk_count += count
+        if self._disk_count:
+            logger.info(f"载入 {self._disk_count} 条上次未发送到麦麦的消息")
+
+    def put(self, message: dict) -> None:
+        """
+        放入一条消息
+        """
+        item = (time.time(), message)
+        if not self._segments and not self._tail and len(self._head) < self.max_size:
+            self._head.append(item)
+            return
+        if not self.disk_overflow or self._disk_count + len(self._tail) >= self.disk_max_size:
+            self.dropped_overflow += 1
+            logger.warning(f"消息缓冲区已满，丢弃消息，累计丢弃 {self.dropped_overflow} 条")
+            return
+        self._tail.append(item)
+        if len(self._tail) >= self.SEGMENT_SIZE:
+            self._flush_tail()
+
+    def _new_segment_path(self, first_item_time: float) -> str:
+        # 以首条消息的入队时间命名，保证按文件名排序即为消息顺序
+        self._segment_seq += 1
+        return os.path.join(SPOOL_DIR, f"{int(first_item_time * 1e6):020d}_{self._segment_seq:06d}.jsonl")
+
+    def _flush_tail(self) -> None:
+        items, self._tail = self._tail, []
+        path = self._new_segment_path(items[0][0])
+        write_task = asyncio.create_task(asyncio.to_thread(self._write_segment, path, items))
+        self._segments.append(SpoolSegment(path, len(items), write_task))
+        self._disk_count += len(items)
+
+    @staticmethod
+    def _write_segment(path: str, items: List[SpoolItem]) -> None:
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for enqueue_time, message in items:
+                f.write(json.dumps([enqueue_time, message], ensure_ascii=False))
+                f.write("\n")
+
+    @staticmethod
+    def _read_segment(path: str) -> List[SpoolItem]:
+        with open(path, "r", encoding="utf-8") as f:
+            items = [tuple(json.loads(line)) for line in f if line.strip()]
+        os.remove(path)
+        return items
+
+    async def _refill_head(self) -> None:
+        if self._head:
+            return
+        if self._segments:
+            segment = self._segments.popleft()
+            self._disk_count -= segment.count
+            try:
+                if segment.write_task is not None:
+                    await segment.write_task
+                self._head.extend(await asyncio.to_thread(self._read_segment, segment.path))
+            except Exception as e:
+                logger.error(f"读取磁盘中缓冲的消息失败，丢弃 {segment.count} 条消息: {e}")
+                self.dropped_overflow += segment.count
+            return
+        self._head.extend(self._tail)
+        self._tail = []
+
+    async def peek(self) -> dict | None:
+        """
+        取出最早的未超时消息（不移除），超时的消息会被丢弃
+        """
+        while True:
+            await self._refill_head()
+            if not self._head:
+                return None
+            enqueue_time, message = self._head[0]
+            if time.time() - enqueue_time <= self.max_age:
+                return message
+            self._head.popleft()
+            self.dropped_expired += 1
+            logger.warning(f"缓冲消息超过 {self.max_age} 秒未能发送，已丢弃，累计丢弃 {self.dropped_expired} 条")
+
+    def pop(self) -> None:
+        """
+        移除peek返回的消息
+        """
+        self._head.popleft()
+        self.replayed += 1
+
+    def close(self) -> None:
+        """
+        将内存中的消息写入磁盘，下次启动时继续发送
+        """
+        if not self.disk_overflow:
+            if self.depth():
+                logger.warning(f"关闭时仍有 {self.depth()} 条消息未发送到麦麦，已丢弃")
+            return
+        if self._head:
+            head = list(self._head)
+            self._write_segment(self._new_segment_path(head[0][0]), head)
+        if self._tail:
+            self._write_segment(self._new_segment_path(self._tail[0][0]), self._tail)
+        self._head.clear()
+        self._tail = []
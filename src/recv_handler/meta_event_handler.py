@@ -27,7 +27,7 @@ class MetaEventHandler:
         elif event_type == MetaEventType.heartbeat:
             if message["status"].get("online") and message["status"].get("good"):
                 if not self._interval_checking:
-                    asyncio.create_task(self.check_heartbeat())
+                    asyncio.create_task(self.check_heartbeat(message.get("self_id")))
                 self.last_heart_beat = time.time()
                 self.interval = message.get("interval") / 1000
             else:
@@ -45,5 +45,3 @@ class MetaEventHandler:
                 logger.debug("心跳正常")
             await asyncio.sleep(self.interval)
 
-
-meta_event_handler = MetaEventHandler()
@@ -1,17 +1,21 @@
 import time
-import json
 import asyncio
 import websockets as Server
 from typing import Tuple, Optional
 
 from src.logger import logger
+from src import codec
 from src.config import global_config
-from src.database import BanUser, db_manager, is_identical
+from src.database import BanUser, async_db_manager
 from . import NoticeType, ACCEPT_FORMAT
 from .message_sending import message_send_instance
-from .message_handler import message_handler
+from .notice_outbox import notice_outbox
+from .message_handler import MessageHandler
+from .ban_scheduler import BanScheduler
 from maim_message import FormatInfo, UserInfo, GroupInfo, Seg, BaseMessageInfo, MessageBase
 
+from src.cache import group_info_cache, member_info_cache
+
 from src.utils import (
     get_group_info,
     get_member_info,
@@ -20,16 +24,13 @@ from src.utils import (
     read_ban_list,
 )
 
-notice_queue: asyncio.Queue[MessageBase] = asyncio.Queue(maxsize=100)
-unsuccessful_notice_queue: asyncio.Queue[MessageBase] = asyncio.Queue(maxsize=3)
-
-
 class NoticeHandler:
-    banned_list: list[BanUser] = []  # 当前仍在禁言中的用户列表
-    lifted_list: list[BanUser] = []  # 已经自然解除禁言
-
-    def __init__(self):
+    def __init__(self, message_handler: MessageHandler, self_id: int):
         self.server_connection: Server.ServerConnection = None
+        self.self_id: int = self_id  # 所属账号，禁言记录按账号归属同步
+        self.message_handler: MessageHandler = message_handler  # 同一连接的消息处理器，用于黑白名单检查
+        self.ban_scheduler: BanScheduler = BanScheduler()  # 禁言记录与自然解除禁言调度
+        self._tasks_started: bool = False
 
     async def set_server_connection(self, server_connection: Server.ServerConnection) -> None:
         """设置Napcat连接"""
@@ -37,39 +38,37 @@ class NoticeHandler:
 
         while self.server_connection.state != Server.State.OPEN:
             await asyncio.sleep(0.5)
-        self.banned_list, self.lifted_list = await read_ban_list(self.server_connection)
+        ban_lists = await read_ban_list(self.server_connection, self.self_id)
+        if ban_lists is None:
+            logger.warning("禁言列表同步失败，保留当前的禁言状态")
+        else:
+            self.ban_scheduler.load(*ban_lists)
 
-        asyncio.create_task(self.auto_lift_detect())
-        asyncio.create_task(self.send_notice())
-        asyncio.create_task(self.handle_natural_lift())
+        if not self._tasks_started:
+            self._tasks_started = True
+            asyncio.create_task(self.ban_scheduler.run())
+            asyncio.create_task(self.handle_natural_lift())
 
     def _ban_operation(self, group_id: int, user_id: Optional[int] = None, lift_time: Optional[int] = None) -> None:
         """
-        将用户禁言记录添加到self.banned_list中
+        添加或更新禁言记录
         如果是全体禁言，则user_id为0
         """
         if user_id is None:
             user_id = 0  # 使用0表示全体禁言
             lift_time = -1
-        ban_record = BanUser(user_id=user_id, group_id=group_id, lift_time=lift_time)
-        for record in self.banned_list:
-            if is_identical(record, ban_record):
-                self.banned_list.remove(record)
-                self.banned_list.append(ban_record)
-                db_manager.create_ban_record(ban_record)  # 作为更新
-                return
-        self.banned_list.append(ban_record)
-        db_manager.create_ban_record(ban_record)  # 添加到数据库
+        ban_record = BanUser(user_id=user_id, group_id=group_id, lift_time=lift_time, self_id=self.self_id)
+        self.ban_scheduler.ban(ban_record)
+        async_db_manager.create_ban_record(ban_record)  # 添加或更新数据库中的记录
 
     def _lift_operation(self, group_id: int, user_id: Optional[int] = None) -> None:
         """
-        从self.lifted_group_list中移除已经解除全体禁言的群
+        移除已经被手动解除的禁言记录
         """
         if user_id is None:
             user_id = 0  # 使用0表示全体禁言
-        ban_record = BanUser(user_id=user_id, group_id=group_id, lift_time=-1)
-        self.lifted_list.append(ban_record)
-        db_manager.delete_ban_record(ban_record)  # 删除数据库中的记录
+        self.ban_scheduler.lift(group_id, user_id)
+        async_db_manager.delete_ban_record(BanUser(user_id=user_id, group_id=group_id, lift_time=-1))  # 删除数据库中的记录
 
     async def handle_notice(self, raw_message: dict) -> None:
         notice_type = raw_message.get("notice_type")
@@ -84,6 +83,13 @@ class NoticeHandler:
         user_info: UserInfo = None
         system_notice: bool = False
 
+        if group_id and self._is_group_info_changed(raw_message):
+            logger.debug(f"群 {group_id} 信息可能已变更，清除群信息缓存")
+            group_info_cache.invalidate(group_id)
+        if group_id and user_id and self._is_member_info_changed(raw_message):
+            logger.debug(f"群 {group_id} 成员 {user_id} 信息可能已变更，清除成员信息缓存")
+            member_info_cache.invalidate((int(group_id), int(user_id)))
+
         match notice_type:
             case NoticeType.friend_recall:
                 logger.info("好友撤回一条消息")
@@ -97,7 +103,7 @@ class NoticeHandler:
                 sub_type = raw_message.get("sub_type")
                 match sub_type:
                     case NoticeType.Notify.poke:
-                        if global_config.chat.enable_poke and await message_handler.check_allow_to_chat(
+                        if global_config.chat.enable_poke and await self.message_handler.check_allow_to_chat(
                             user_id, group_id, False, False
                         ):
                             logger.info("处理戳一戳消息")
@@ -110,13 +116,13 @@ class NoticeHandler:
                 sub_type = raw_message.get("sub_type")
                 match sub_type:
                     case NoticeType.GroupBan.ban:
-                        if not await message_handler.check_allow_to_chat(user_id, group_id, True, False):
+                        if not await self.message_handler.check_allow_to_chat(user_id, group_id, True, False):
                             return None
                         logger.info("处理群禁言")
                         handled_message, user_info = await self.handle_ban_notify(raw_message, group_id)
                         system_notice = True
                     case NoticeType.GroupBan.lift_ban:
-                        if not await message_handler.check_allow_to_chat(user_id, group_id, True, False):
+                        if not await self.message_handler.check_allow_to_chat(user_id, group_id, True, False):
                             return None
                         logger.info("处理解除群禁言")
                         handled_message, user_info = await self.handle_lift_ban_notify(raw_message, group_id)
@@ -161,7 +167,7 @@ class NoticeHandler:
         message_base: MessageBase = MessageBase(
             message_info=message_info,
             message_segment=handled_message,
-            raw_message=json.dumps(raw_message),
+            raw_message=codec.dumps(raw_message),
         )
 
         if system_notice:
@@ -170,6 +176,34 @@ class NoticeHandler:
             logger.info("发送到Maibot处理通知信息")
             await message_send_instance.message_send(message_base)
 
+    @staticmethod
+    def _is_group_info_changed(raw_message: dict) -> bool:
+        """
+        判断通知是否会导致群信息（群名、人数、全体禁言状态）变化
+        """
+        notice_type = raw_message.get("notice_type")
+        if notice_type in [NoticeType.group_increase, NoticeType.group_decrease]:
+            return True
+        if notice_type == NoticeType.group_ban:
+            return raw_message.get("user_id") == 0
+        if notice_type == NoticeType.notify:
+            return raw_message.get("sub_type") == NoticeType.Notify.group_name
+        return False
+
+    @staticmethod
+    def _is_member_info_changed(raw_message: dict) -> bool:
+        """
+        判断通知是否会导致群成员信息（名片、权限、禁言时间）变化
+        """
+        notice_type = raw_message.get("notice_type")
+        return notice_type in [
+            NoticeType.group_ban,
+            NoticeType.group_card,
+            NoticeType.group_admin,
+            NoticeType.group_increase,
+            NoticeType.group_decrease,
+        ]
+
     async def handle_poke_notify(
         self, raw_message: dict, group_id: int, user_id: int
     ) -> Tuple[Seg | None, UserInfo | None]:
@@ -371,65 +405,58 @@ class NoticeHandler:
 
     async def put_notice(self, message_base: MessageBase) -> None:
         """
-        将处理后的通知消息放入通知队列
+        将处理后的通知消息放入发件箱，由发件箱负责持久化与重试
         """
-        if notice_queue.full() or unsuccessful_notice_queue.full():
-            logger.warning("通知队列已满，可能是多次发送失败，消息丢弃")
-        else:
-            await notice_queue.put(message_base)
+        await notice_outbox.put(message_base)
 
     async def handle_natural_lift(self) -> None:
         while True:
-            if len(self.lifted_list) != 0:
-                lift_record = self.lifted_list.pop()
-                group_id = lift_record.group_id
-                user_id = lift_record.user_id
+            lift_record = await self.ban_scheduler.lifted_queue.get()
+            group_id = lift_record.group_id
+            user_id = lift_record.user_id
 
-                db_manager.delete_ban_record(lift_record)  # 从数据库中删除禁言记录
+            async_db_manager.delete_ban_record(lift_record)  # 从数据库中删除禁言记录
 
-                seg_message: Seg = await self.natural_lift(group_id, user_id)
+            seg_message: Seg = await self.natural_lift(group_id, user_id)
 
-                fetched_group_info = await get_group_info(self.server_connection, group_id)
-                group_name: str = None
-                if fetched_group_info:
-                    group_name = fetched_group_info.get("group_name")
-                else:
-                    logger.warning("无法获取notice消息所在群的名称")
-                group_info = GroupInfo(
-                    platform=global_config.maibot_server.platform_name,
-                    group_id=group_id,
-                    group_name=group_name,
-                )
-
-                message_info: BaseMessageInfo = BaseMessageInfo(
-                    platform=global_config.maibot_server.platform_name,
-                    message_id="notice",
-                    time=time.time(),
-                    user_info=None,  # 自然解除禁言没有操作者
-                    group_info=group_info,
-                    template_info=None,
-                    format_info=None,
-                )
-
-                message_base: MessageBase = MessageBase(
-                    message_info=message_info,
-                    message_segment=seg_message,
-                    raw_message=json.dumps(
-                        {
-                            "post_type": "notice",
-                            "notice_type": "group_ban",
-                            "sub_type": "lift_ban",
-                            "group_id": group_id,
-                            "user_id": user_id,
-                            "operator_id": None,  # 自然解除禁言没有操作者
-                        }
-                    ),
-                )
-
-                await self.put_notice(message_base)
-                await asyncio.sleep(0.5)  # 确保队列处理间隔
+            fetched_group_info = await get_group_info(self.server_connection, group_id)
+            group_name: str = None
+            if fetched_group_info:
+                group_name = fetched_group_info.get("group_name")
             else:
-                await asyncio.sleep(5)  # 每5秒检查一次
+                logger.warning("无法获取notice消息所在群的名称")
+            group_info = GroupInfo(
+                platform=global_config.maibot_server.platform_name,
+                group_id=group_id,
+                group_name=group_name,
+            )
+
+            message_info: BaseMessageInfo = BaseMessageInfo(
+                platform=global_config.maibot_server.platform_name,
+                message_id="notice",
+                time=time.time(),
+                user_info=None,  # 自然解除禁言没有操作者
+                group_info=group_info,
+                template_info=None,
+                format_info=None,
+            )
+
+            message_base: MessageBase = MessageBase(
+                message_info=message_info,
+                message_segment=seg_message,
+                raw_message=codec.dumps(
+                    {
+                        "post_type": "notice",
+                        "notice_type": "group_ban",
+                        "sub_type": "lift_ban",
+                        "group_id": group_id,
+                        "user_id": user_id,
+                        "operator_id": None,  # 自然解除禁言没有操作者
+                    }
+                ),
+            )
+
+            await self.put_notice(message_base)
 
     async def natural_lift(self, group_id: int, user_id: int) -> Seg | None:
         if not group_id:
@@ -467,50 +494,3 @@ class NoticeHandler:
             },
         )
 
-    async def auto_lift_detect(self) -> None:
-        while True:
-            if len(self.banned_list) == 0:
-                await asyncio.sleep(5)
-                continue
-            for ban_record in self.banned_list:
-                if ban_record.user_id == 0 or ban_record.lift_time == -1:
-                    continue
-                if ban_record.lift_time <= int(time.time()):
-                    # 触发自然解除禁言
-                    logger.info(f"检测到用户 {ban_record.user_id} 在群 {ban_record.group_id} 的禁言已解除")
-                    self.lifted_list.append(ban_record)
-                    self.banned_list.remove(ban_record)
-            await asyncio.sleep(5)
-
-    async def send_notice(self) -> None:
-        """
-        发送通知消息到Napcat
-        """
-        while True:
-            if not unsuccessful_notice_queue.empty():
-                to_be_send: MessageBase = await unsuccessful_notice_queue.get()
-                try:
-                    send_status = await message_send_instance.message_send(to_be_send)
-                    if send_status:
-                        unsuccessful_notice_queue.task_done()
-                    else:
-                        await unsuccessful_notice_queue.put(to_be_send)
-                except Exception as e:
-                    logger.error(f"发送通知消息失败: {str(e)}")
-                    await unsuccessful_notice_queue.put(to_be_send)
-                await asyncio.sleep(1)
-                continue
-            to_be_send: MessageBase = await notice_queue.get()
-            try:
-                send_status = await message_send_instance.message_send(to_be_send)
-                if send_status:
-                    notice_queue.task_done()
-                else:
-                    await unsuccessful_notice_queue.put(to_be_send)
-            except Exception as e:
-                logger.error(f"发送通知消息失败: {str(e)}")
-                await unsuccessful_notice_queue.put(to_be_send)
-            await asyncio.sleep(1)
-
-
-notice_handler = NoticeHandler()
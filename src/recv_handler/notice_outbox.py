@@ -0,0 +1,141 @@
+import time
+import json
+import heapq
+import random
+import asyncio
+import uuid
+from typing import Dict, List, Set, Tuple
+
+from maim_message import MessageBase
+
+from src.logger import logger
+from src.config import global_config
+from src.database import OutboxNotice, async_db_manager
+from .message_sending import message_send_instance
+
+
+class NoticeOutbox:
+    """
+    发往麦麦的通知发件箱
+
+    通知在发送前写入数据库，发送成功后删除，重启后继续发送未完成的通知。
+    发送失败的通知按指数退避（带随机抖动）重试；
+    麦麦正常时并发发送，发送失败后只保留一条试探发送，直到发送成功再恢复并发
+    """
+
+    def __init__(self):
+        self.concurrency: int = global_config.maibot_server.notice_send_concurrency
+        self.base_delay: float = global_config.maibot_server.notice_retry_base_delay
+        self.max_delay: float = global_config.maibot_server.notice_retry_max_delay
+        self.max_age: int = global_config.maibot_server.notice_max_age
+        self._notices: Dict[str, OutboxNotice] = {}  # 所有未发送成功的通知
+        self._heap: List[Tuple[float, float, str]] = []  # (next_attempt_time, create_time, notice_id)
+        self._sending: Set[str] = set()
+        self._healthy: bool = True  # 最近一次发送是否成功
+        self._wakeup = asyncio.Event()
+        self.sent_count: int = 0
+        self.retry_count: int = 0
+        self.expired_count: int = 0
+
+    def qsize(self) -> int:
+        return len(self._notices)
+
+    async def put(self, message_base: MessageBase) -> None:
+        """
+        将通知放入发件箱
+        """
+        now = time.time()
+        notice = OutboxNotice(
+            notice_id=uuid.uuid4().hex,
+            content=json.dumps(message_base.to_dict(), ensure_ascii=False),
+            create_time=now,
+            next_attempt_time=now,
+        )
+        async_db_manager.save_outbox_notice(notice)  # 写入顺序保证了删除总在保存之后
+        self._schedule(notice)
+
+    def _schedule(self, notice: OutboxNotice) -> None:
+        self._notices[notice.notice_id] = notice
+        heapq.heappush(self._heap, (notice.next_attempt_time, notice.create_time, notice.notice_id))
+        self._wakeup.set()
+
+    async def _load(self) -> None:
+        """
+        载入上次运行时未发送成功的通知
+        """
+        try:
+            notices = await async_db_manager.get_outbox_notices()
+        except Exception as e:
+            logger.error(f"读取未发送的通知失败: {e}")
+            return
+        loaded = 0
+        for notice in notices:
+            if notice.notice_id not in self._notices:
+                self._schedule(notice)
+                loaded += 1
+        if loaded:
+            logger.info(f"载入 {loaded} 条上次未发送成功的通知，将继续发送")
+
+    def _can_dispatch(self) -> bool:
+        if self._healthy:
+            return len(self._sending) < self.concurrency
+        return not self._sending  # 麦麦异常时只保留一条试探发送
+
+    async def run(self) -> None:
+        await self._load()
+        while True:
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now and self._can_dispatch():
+                _, _, notice_id = heapq.heappop(self._heap)
+                notice = self._notices.get(notice_id)
+                if notice is None:
+                    continue
+                if now - notice.create_time > self.max_age:
+                    logger.warning(f"通知超过 {self.max_age} 秒仍未发送成功，已丢弃")
+                    self._drop(notice)
+                    self.expired_count += 1
+                    continue
+                self._sending.add(notice_id)
+                asyncio.create_task(self._deliver(notice))
+            self._wakeup.clear()
+            timeout = None
+            if self._heap and self._can_dispatch():
+                timeout = max(self._heap[0][0] - time.time(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _deliver(self, notice: OutboxNotice) -> None:
+        try:
+            message_base = MessageBase.from_dict(json.loads(notice.content))
+            send_status = await message_send_instance.message_send(message_base, spool=False)  # 由发件箱负责重试
+        except Exception as e:
+            logger.error(f"发送通知消息失败: {str(e)}")
+            send_status = False
+        finally:
+            self._sending.discard(notice.notice_id)
+            self._wakeup.set()
+        if send_status:
+            if not self._healthy:
+                logger.info(f"通知发送恢复正常，剩余待发送通知 {len(self._notices) - 1} 条")
+            self._healthy = True
+            self.sent_count += 1
+            self._drop(notice)
+            return
+        self._healthy = False
+        self.retry_count += 1
+        notice.attempts += 1
+        delay = min(self.max_delay, self.base_delay * 2 ** (notice.attempts - 1))
+        delay = random.uniform(delay / 2, delay)  # 随机抖动，避免恢复时集中重试
+        notice.next_attempt_time = time.time() + delay
+        logger.warning(f"通知发送失败（第 {notice.attempts} 次），{delay:.1f} 秒后重试")
+        async_db_manager.save_outbox_notice(notice)
+        self._schedule(notice)
+
+    def _drop(self, notice: OutboxNotice) -> None:
+        self._notices.pop(notice.notice_id, None)
+        async_db_manager.delete_outbox_notice(notice.notice_id)
+
+
+notice_outbox = NoticeOutbox()
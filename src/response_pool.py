@@ -1,44 +1,70 @@
 import asyncio
 import time
-from typing import Dict
+from typing import Dict, Set
 from .config import global_config
 from .logger import logger
 
-response_dict: Dict = {}
-response_time_dict: Dict = {}
+response_dict: Dict[str, asyncio.Future] = {}
+response_time_dict: Dict[str, float] = {}
+awaited_requests: Set[str] = set()  # 正在被get_response等待的请求，由其自身的超时负责清理
+
+
+def register_request(request_id: str) -> asyncio.Future:
+    """
+    为请求注册一个等待响应的Future
+
+    需要在发送请求之前调用，以免响应先于等待者到达而被丢弃
+    """
+    future = response_dict.get(request_id)
+    if future is None:
+        future = asyncio.get_running_loop().create_future()
+        response_dict[request_id] = future
+        response_time_dict[request_id] = time.time()
+    return future
 
 
 async def get_response(request_id: str, timeout: int = 10) -> dict:
-    response = await asyncio.wait_for(_get_response(request_id), timeout)
-    _ = response_time_dict.pop(request_id)
+    future = response_dict.get(request_id)
+    if future is None:
+        future = register_request(request_id)
+    awaited_requests.add(request_id)
+    try:
+        response = await asyncio.wait_for(future, timeout)
+    finally:
+        awaited_requests.discard(request_id)
+        response_dict.pop(request_id, None)
+        response_time_dict.pop(request_id, None)
     logger.trace(f"响应信息id: {request_id} 已从响应字典中取出")
     return response
 
-async def _get_response(request_id: str) -> dict:
-    """
-    内部使用的获取响应函数，主要用于在需要时获取响应
-    """
-    while request_id not in response_dict:
-        await asyncio.sleep(0.2)
-    return response_dict.pop(request_id)
 
 async def put_response(response: dict):
     echo_id = response.get("echo")
-    now_time = time.time()
-    response_dict[echo_id] = response
-    response_time_dict[echo_id] = now_time
-    logger.trace(f"响应信息id: {echo_id} 已存入响应字典")
+    future = response_dict.get(echo_id)
+    if future is None or future.done():
+        logger.trace(f"响应信息id: {echo_id} 无等待者或已超时，已丢弃")
+        return
+    future.set_result(response)
+    logger.trace(f"响应信息id: {echo_id} 已交付给等待者")
 
 
 async def check_timeout_response() -> None:
+    """
+    清理已注册但无人等待的请求（例如发送请求时出现异常）
+
+    正在等待中的请求不会被清理，也不会取消任何Future，以免等待者收到CancelledError
+    """
     while True:
         cleaned_message_count: int = 0
         now_time = time.time()
-        for echo_id, response_time in list(response_time_dict.items()):
-            if now_time - response_time > global_config.napcat_server.heartbeat_interval:
+        for echo_id, register_time in list(response_time_dict.items()):
+            if echo_id in awaited_requests:
+                continue
+            if now_time - register_time > global_config.napcat_server.heartbeat_interval * 2:
                 cleaned_message_count += 1
-                response_dict.pop(echo_id)
-                response_time_dict.pop(echo_id)
-                logger.warning(f"响应消息 {echo_id} 超时，已删除")
-        logger.info(f"已删除 {cleaned_message_count} 条超时响应消息")
+                response_dict.pop(echo_id, None)
+                response_time_dict.pop(echo_id, None)
+                logger.warning(f"请求 {echo_id} 长时间未被取走，已删除")
+        if cleaned_message_count:
+            logger.info(f"已删除 {cleaned_message_count} 条超时请求")
         await asyncio.sleep(global_config.napcat_server.heartbeat_interval)
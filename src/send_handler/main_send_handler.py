@@ -1,3 +1,4 @@
+import asyncio
 from typing import Any, Dict
 from maim_message import (
     UserInfo,
@@ -7,9 +8,10 @@ from maim_message import (
     MessageBase,
 )
 from src.logger import logger
+from src.utils import convert_emoji_to_gif
 from .send_command_handler import SendCommandHandleClass
 from .send_message_handler import SendMessageHandleClass
-from .nc_sending import nc_message_sender
+from src.connection_registry import connection_registry
 
 
 class SendHandler:
@@ -44,7 +46,15 @@ class SendHandler:
             logger.error("命令或参数缺失")
             return None
 
-        response = await nc_message_sender.send_message_to_napcat(command, args_dict)
+        context = connection_registry.route(
+            group_id=group_info.group_id if group_info else args_dict.get("group_id"),
+            user_id=args_dict.get("user_id"),
+        )
+        if context is None:
+            logger.error(f"命令 {seg_data.get('name')} 无法发送，没有可用的Napcat连接")
+            return None
+
+        response = await context.nc_message_sender.send_message_to_napcat(command, args_dict)
         if response.get("status") == "ok":
             logger.info(f"命令 {seg_data.get('name')} 执行成功")
         else:
@@ -64,6 +74,7 @@ class SendHandler:
         id_name: str = None
         processed_message: list = []
         try:
+            await self.prepare_emoji_seg(message_segment)
             processed_message = SendMessageHandleClass.process_seg_recursive(message_segment)
         except Exception as e:
             logger.error(f"处理消息时发生错误: {e}")
@@ -86,8 +97,15 @@ class SendHandler:
         else:
             logger.error("无法识别的消息类型")
             return
-        logger.info("尝试发送到napcat")
-        response = await nc_message_sender.send_message_to_napcat(
+        context = connection_registry.route(
+            group_id=target_id if id_name == "group_id" else None,
+            user_id=target_id if id_name == "user_id" else None,
+        )
+        if context is None:
+            logger.error("消息无法发送，没有可用的Napcat连接")
+            return
+        logger.info(f"尝试通过Bot {context.self_id} 发送到napcat")
+        response = await context.nc_message_sender.send_message_to_napcat(
             action,
             {
                 id_name: target_id,
@@ -97,8 +115,32 @@ class SendHandler:
         if response.get("status") == "ok":
             logger.info("消息发送成功")
             qq_message_id = response.get("data", {}).get("message_id")
-            await nc_message_sender.message_sent_back(raw_message_base, qq_message_id)
+            await context.nc_message_sender.message_sent_back(raw_message_base, qq_message_id, processed_message)
         else:
             logger.warning(f"消息发送失败，napcat返回：{str(response)}")
 
-send_handler = SendHandler()
\ No newline at end of file
+    async def prepare_emoji_seg(self, seg_data: Seg) -> None:
+        """
+        预先在线程池中将表情包转换为GIF格式（结果会被缓存），避免在事件循环中同步转换
+        """
+        if seg_data.type == "seglist":
+            await asyncio.gather(*(self.prepare_emoji_seg(seg) for seg in seg_data.data or []))
+        elif seg_data.type == "emoji" and seg_data.data:
+            seg_data.data = await convert_emoji_to_gif(seg_data.data)
+        elif seg_data.type == "forward" and seg_data.data:
+            # 转发消息的节点以字典形式保存，发送时才转换为MessageBase
+            await asyncio.gather(
+                *(self._prepare_emoji_dict(item.get("message_segment") or {}) for item in seg_data.data)
+            )
+
+    async def _prepare_emoji_dict(self, seg_dict: dict) -> None:
+        """
+        prepare_emoji_seg的字典版本，用于转发消息节点中的消息段
+        """
+        if seg_dict.get("type") == "seglist":
+            await asyncio.gather(*(self._prepare_emoji_dict(seg) for seg in seg_dict.get("data") or []))
+        elif seg_dict.get("type") == "emoji" and seg_dict.get("data"):
+            seg_dict["data"] = await convert_emoji_to_gif(seg_dict["data"])
+
+
+send_handler = SendHandler()
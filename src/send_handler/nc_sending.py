@@ -1,11 +1,12 @@
-import json
-import uuid
 import websockets as Server
+from typing import List
 from maim_message import MessageBase
 
-from src.response_pool import get_response
+from src.napcat_client import napcat_client
 from src.logger import logger
+from src.recent_message_store import recent_message_store
 from src.recv_handler.message_sending import message_send_instance
+from src.utils import get_self_info
 
 class NCMessageSender:
     def __init__(self):
@@ -15,11 +16,8 @@ class NCMessageSender:
         self.server_connection = connection
     
     async def send_message_to_napcat(self, action: str, params: dict) -> dict:
-        request_uuid = str(uuid.uuid4())
-        payload = json.dumps({"action": action, "params": params, "echo": request_uuid})
-        await self.server_connection.send(payload)
         try:
-            response = await get_response(request_uuid)
+            response = await napcat_client.send_action(self.server_connection, action, params)
         except TimeoutError:
             logger.error("发送消息超时，未收到响应")
             return {"status": "error", "message": "timeout"}
@@ -28,7 +26,12 @@ class NCMessageSender:
             return {"status": "error", "message": str(e)}
         return response
     
-    async def message_sent_back(self, message_base: MessageBase, qq_message_id: str) -> None:
+    async def message_sent_back(self, message_base: MessageBase, qq_message_id: str, sent_message: List[dict]) -> None:
+        if self_info := await get_self_info(self.server_connection):
+            group_info = message_base.message_info.group_info
+            recent_message_store.put_sent(
+                qq_message_id, sent_message, self_info, group_info.group_id if group_info else None
+            )
         # # 修改 additional_config，添加 echo 字段
         # if message_base.message_info.additional_config is None:
         #     message_base.message_info.additional_config = {}
@@ -57,5 +60,3 @@ class NCMessageSender:
             logger.debug("已回送消息ID")
         else:
             logger.error("回送消息ID失败")
-
-nc_message_sender = NCMessageSender()
\ No newline at end of file
@@ -3,7 +3,7 @@ from typing import List, Dict
 
 from src.logger import logger
 from src.config import global_config
-from src.utils import get_image_format, convert_image_to_gif
+from src.utils import is_gif
 
 
 class SendMessageHandleClass:
@@ -134,11 +134,10 @@ class SendMessageHandleClass:
 
     @staticmethod
     def handle_emoji_message(encoded_emoji: str) -> dict:
-        """处理表情消息"""
+        """处理表情消息，表情包应已由SendHandler.prepare_emoji_seg转换为GIF，此处只检查文件头而不再转换"""
+        if not is_gif(encoded_emoji):
+            logger.debug("表情包未能转换为GIF，按原格式发送")
         encoded_image = encoded_emoji
-        image_format = get_image_format(encoded_emoji)
-        if image_format != "gif":
-            encoded_image = convert_image_to_gif(encoded_emoji)
         return {
             "type": "image",
             "data": {
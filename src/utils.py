@@ -1,48 +1,52 @@
 import websockets as Server
-import json
 import base64
-import uuid
-import urllib3
-import ssl
 import io
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from src.database import BanUser, db_manager
+from src.database import BanUser, async_db_manager
+from .config import global_config
+from .cache import group_info_cache, member_info_cache, emoji_gif_cache, self_info_cache
 from .logger import logger
-from .response_pool import get_response
+from .media_downloader import media_downloader
+from .media_cache import media_cache
+from .napcat_client import napcat_client
 
 from PIL import Image
-from typing import Union, List, Tuple, Optional
+from typing import Union, List, Tuple, Optional, Dict
 
+image_convert_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image_convert")
 
-class SSLAdapter(urllib3.PoolManager):
-    def __init__(self, *args, **kwargs):
-        context = ssl.create_default_context()
-        context.set_ciphers("DEFAULT@SECLEVEL=1")
-        context.minimum_version = ssl.TLSVersion.TLSv1_2
-        kwargs["ssl_context"] = context
-        super().__init__(*args, **kwargs)
 
-
-async def get_group_info(websocket: Server.ServerConnection, group_id: int) -> dict | None:
+async def get_group_info(websocket: Server.ServerConnection, group_id: int, no_cache: bool = False) -> dict | None:
     """
-    获取群相关信息
+    获取群相关信息，默认优先使用缓存
 
     返回值需要处理可能为空的情况
+    Parameters:
+        websocket: WebSocket连接对象
+        group_id: 群号
+        no_cache: 是否跳过缓存，直接从Napcat获取最新信息
     """
+    if no_cache:
+        group_info_cache.invalidate(group_id)
+    return await group_info_cache.get_or_fetch(group_id, lambda: _fetch_group_info(websocket, group_id))
+
+
+async def _fetch_group_info(websocket: Server.ServerConnection, group_id: int) -> dict | None:
     logger.debug("获取群聊信息中")
-    request_uuid = str(uuid.uuid4())
-    payload = json.dumps({"action": "get_group_info", "params": {"group_id": group_id}, "echo": request_uuid})
     try:
-        await websocket.send(payload)
-        socket_response: dict = await get_response(request_uuid)
+        group_info = await napcat_client.get_group_info(websocket, group_id)
     except TimeoutError:
         logger.error(f"获取群信息超时，群号: {group_id}")
         return None
     except Exception as e:
         logger.error(f"获取群信息失败: {e}")
         return None
-    logger.debug(socket_response)
-    return socket_response.get("data")
+    logger.debug(group_info)
+    return group_info
 
 
 async def get_group_detail_info(websocket: Server.ServerConnection, group_id: int) -> dict | None:
@@ -52,59 +56,113 @@ async def get_group_detail_info(websocket: Server.ServerConnection, group_id: in
     返回值需要处理可能为空的情况
     """
     logger.debug("获取群详细信息中")
-    request_uuid = str(uuid.uuid4())
-    payload = json.dumps({"action": "get_group_detail_info", "params": {"group_id": group_id}, "echo": request_uuid})
     try:
-        await websocket.send(payload)
-        socket_response: dict = await get_response(request_uuid)
+        group_detail_info = await napcat_client.get_group_detail_info(websocket, group_id)
     except TimeoutError:
         logger.error(f"获取群详细信息超时，群号: {group_id}")
         return None
     except Exception as e:
         logger.error(f"获取群详细信息失败: {e}")
         return None
-    logger.debug(socket_response)
-    return socket_response.get("data")
+    logger.debug(group_detail_info)
+    return group_detail_info
 
 
-async def get_member_info(websocket: Server.ServerConnection, group_id: int, user_id: int) -> dict | None:
+async def get_member_info(
+    websocket: Server.ServerConnection, group_id: int, user_id: int, no_cache: bool = False, cache_only: bool = False
+) -> dict | None:
     """
-    获取群成员信息
+    获取群成员信息，默认优先使用缓存
 
     返回值需要处理可能为空的情况
+    Parameters:
+        websocket: WebSocket连接对象
+        group_id: 群号
+        user_id: 用户ID
+        no_cache: 是否需要最新数据（如禁言时间），为True时跳过Adapter与Napcat两侧的缓存
+        cache_only: 只从缓存获取，未命中时返回None而不请求Napcat
     """
-    logger.debug("获取群成员信息中")
-    request_uuid = str(uuid.uuid4())
-    payload = json.dumps(
-        {
-            "action": "get_group_member_info",
-            "params": {"group_id": group_id, "user_id": user_id, "no_cache": True},
-            "echo": request_uuid,
-        }
+    # OneBot消息段中的QQ号为字符串，统一为整数，保证与通知中的失效操作使用相同的键
+    key = (int(group_id) if group_id else group_id, int(user_id) if user_id else user_id)
+    if cache_only:
+        return member_info_cache.get(key)
+    if no_cache:
+        member_info_cache.invalidate(key)
+    return await member_info_cache.get_or_fetch(
+        key, lambda: _fetch_member_info(websocket, group_id, user_id, no_cache)
     )
+
+
+async def _fetch_member_info(
+    websocket: Server.ServerConnection, group_id: int, user_id: int, no_cache: bool
+) -> dict | None:
+    logger.debug("获取群成员信息中")
     try:
-        await websocket.send(payload)
-        socket_response: dict = await get_response(request_uuid)
+        member_info = await napcat_client.get_group_member_info(websocket, group_id, user_id, no_cache)
     except TimeoutError:
         logger.error(f"获取成员信息超时，群号: {group_id}, 用户ID: {user_id}")
         return None
     except Exception as e:
         logger.error(f"获取成员信息失败: {e}")
         return None
-    logger.debug(socket_response)
-    return socket_response.get("data")
+    logger.debug(member_info)
+    return member_info
 
 
-async def get_image_base64(url: str) -> str:
-    # sourcery skip: raise-specific-error
-    """获取图片/表情包的Base64"""
+async def get_group_member_list(
+    websocket: Server.ServerConnection, group_id: int, no_cache: bool = False
+) -> List[dict] | None:
+    """
+    获取群成员列表
+
+    返回值需要处理可能为空的情况
+    """
+    logger.debug("获取群成员列表中")
+    try:
+        member_list = await napcat_client.get_group_member_list(websocket, group_id, no_cache)
+    except TimeoutError:
+        logger.error(f"获取群成员列表超时，群号: {group_id}")
+        return None
+    except Exception as e:
+        logger.error(f"获取群成员列表失败: {e}")
+        return None
+    logger.debug(f"{str(member_list)[:200]}...")  # 防止成员列表过长导致日志过长
+    return member_list
+
+
+async def get_group_list(websocket: Server.ServerConnection) -> List[dict] | None:
+    """
+    获取自身所在的群列表
+
+    返回值需要处理可能为空的情况
+    """
+    logger.debug("获取群列表中")
+    try:
+        group_list = await napcat_client.get_group_list(websocket)
+    except TimeoutError:
+        logger.error("获取群列表超时")
+        return None
+    except Exception as e:
+        logger.error(f"获取群列表失败: {e}")
+        return None
+    logger.debug(f"{str(group_list)[:200]}...")
+    return group_list
+
+
+async def get_image_base64(url: str, cache_key: Optional[str] = None) -> str:
+    """
+    获取图片/表情包的Base64，优先从本地媒体缓存读取
+    Parameters:
+        url: str: 图片URL
+        cache_key: str: 缓存键（如QQ的文件ID），为空时使用URL
+    """
+    cache_key = cache_key or url
+    if image_bytes := await media_cache.get(cache_key):
+        return base64.b64encode(image_bytes).decode("utf-8")
     logger.debug(f"下载图片: {url}")
-    http = SSLAdapter()
     try:
-        response = http.request("GET", url, timeout=10)
-        if response.status != 200:
-            raise Exception(f"HTTP Error: {response.status}")
-        image_bytes = response.data
+        image_bytes = await media_downloader.download(url)
+        await media_cache.put(cache_key, image_bytes)
         return base64.b64encode(image_bytes).decode("utf-8")
     except Exception as e:
         logger.error(f"图片下载失败: {str(e)}")
@@ -133,38 +191,103 @@ def convert_image_to_gif(image_base64: str) -> str:
         return image_base64
 
 
-async def get_self_info(websocket: Server.ServerConnection) -> dict | None:
+def emoji_cache_key(image_base64: str) -> str:
+    return hashlib.sha1(image_base64.encode("utf-8")).hexdigest()
+
+
+def is_gif(image_base64: str) -> bool:
+    """
+    仅根据文件头判断Base64编码的图片是否为GIF，不会完整解码
     """
-    获取自身信息
+    try:
+        return _sniff_image_format(base64.b64decode(image_base64[:64])) == "gif"
+    except ValueError:
+        return False
+
+
+def ensure_gif(image_base64: str) -> str:
+    """
+    确保表情包为GIF格式，非GIF格式的图片会被转换
+    Parameters:
+        image_base64: str: Base64编码的图片数据
+    Returns:
+        str: Base64编码的GIF图片数据
+    """
+    if get_image_format(image_base64) == "gif":
+        return image_base64
+    return convert_image_to_gif(image_base64)
+
+
+async def convert_emoji_to_gif(image_base64: str) -> str:
+    """
+    异步将表情包转换为GIF格式
+
+    转换结果按内容哈希缓存，未命中时在线程池中转换，避免阻塞事件循环
+    """
+    loop = asyncio.get_running_loop()
+    return await emoji_gif_cache.get_or_fetch(
+        emoji_cache_key(image_base64),
+        lambda: loop.run_in_executor(image_convert_executor, ensure_gif, image_base64),
+    )
+
+
+async def get_self_info(websocket: Server.ServerConnection, cache_only: bool = False) -> dict | None:
+    """
+    获取自身信息，优先使用缓存
     Parameters:
         websocket: WebSocket连接对象
+        cache_only: 只从缓存获取，未命中时返回None而不请求Napcat
     Returns:
         data: dict: 返回的自身信息
     """
+    if cache_only:
+        return self_info_cache.get(websocket)
+    return await self_info_cache.get_or_fetch(websocket, lambda: _fetch_self_info(websocket))
+
+
+async def _fetch_self_info(websocket: Server.ServerConnection) -> dict | None:
     logger.debug("获取自身信息中")
-    request_uuid = str(uuid.uuid4())
-    payload = json.dumps({"action": "get_login_info", "params": {}, "echo": request_uuid})
     try:
-        await websocket.send(payload)
-        response: dict = await get_response(request_uuid)
+        self_info = await napcat_client.get_login_info(websocket)
     except TimeoutError:
         logger.error("获取自身信息超时")
         return None
     except Exception as e:
         logger.error(f"获取自身信息失败: {e}")
         return None
-    logger.debug(response)
-    return response.get("data")
+    logger.debug(self_info)
+    return self_info
+
+
+def _sniff_image_format(header: bytes) -> str | None:
+    """
+    根据文件头的魔数判断图片格式，无法识别时返回None
+    """
+    if header.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    return None
 
 
 def get_image_format(raw_data: str) -> str:
     """
     从Base64编码的数据中确定图片的格式。
+    仅解码开头的少量数据并匹配文件头，无法识别时才完整解码交给PIL判断。
     Parameters:
         raw_data: str: Base64编码的图片数据。
     Returns:
         format: str: 图片的格式（例如 'jpeg', 'png', 'gif'）。
     """
+    try:
+        if image_format := _sniff_image_format(base64.b64decode(raw_data[:64])):
+            return image_format
+    except ValueError:
+        pass
     image_bytes = base64.b64decode(raw_data)
     return Image.open(io.BytesIO(image_bytes)).format.lower()
 
@@ -179,19 +302,16 @@ async def get_stranger_info(websocket: Server.ServerConnection, user_id: int) ->
         dict: 返回的陌生人信息
     """
     logger.debug("获取陌生人信息中")
-    request_uuid = str(uuid.uuid4())
-    payload = json.dumps({"action": "get_stranger_info", "params": {"user_id": user_id}, "echo": request_uuid})
     try:
-        await websocket.send(payload)
-        response: dict = await get_response(request_uuid)
+        stranger_info = await napcat_client.get_stranger_info(websocket, user_id)
     except TimeoutError:
         logger.error(f"获取陌生人信息超时，用户ID: {user_id}")
         return None
     except Exception as e:
         logger.error(f"获取陌生人信息失败: {e}")
         return None
-    logger.debug(response)
-    return response.get("data")
+    logger.debug(stranger_info)
+    return stranger_info
 
 
 async def get_message_detail(websocket: Server.ServerConnection, message_id: Union[str, int]) -> dict | None:
@@ -204,19 +324,16 @@ async def get_message_detail(websocket: Server.ServerConnection, message_id: Uni
         dict: 返回的消息详情
     """
     logger.debug("获取消息详情中")
-    request_uuid = str(uuid.uuid4())
-    payload = json.dumps({"action": "get_msg", "params": {"message_id": message_id}, "echo": request_uuid})
     try:
-        await websocket.send(payload)
-        response: dict = await get_response(request_uuid, 30)  # 增加超时时间到30秒
+        message_detail = await napcat_client.get_msg(websocket, message_id)
     except TimeoutError:
         logger.error(f"获取消息详情超时，消息ID: {message_id}")
         return None
     except Exception as e:
         logger.error(f"获取消息详情失败: {e}")
         return None
-    logger.debug(response)
-    return response.get("data")
+    logger.debug(message_detail)
+    return message_detail
 
 
 async def get_record_detail(
@@ -232,79 +349,132 @@ async def get_record_detail(
         dict: 返回的语音消息详情
     """
     logger.debug("获取语音消息详情中")
-    request_uuid = str(uuid.uuid4())
-    payload = json.dumps(
-        {
-            "action": "get_record",
-            "params": {"file": file, "file_id": file_id, "out_format": "wav"},
-            "echo": request_uuid,
-        }
-    )
     try:
-        await websocket.send(payload)
-        response: dict = await get_response(request_uuid, 30)  # 增加超时时间到30秒
+        record_detail = await napcat_client.get_record(websocket, file, file_id)
     except TimeoutError:
         logger.error(f"获取语音消息详情超时，文件: {file}, 文件ID: {file_id}")
         return None
     except Exception as e:
         logger.error(f"获取语音消息详情失败: {e}")
         return None
-    logger.debug(f"{str(response)[:200]}...")  # 防止语音的超长base64编码导致日志过长
-    return response.get("data")
+    logger.debug(f"{str(record_detail)[:200]}...")  # 防止语音的超长base64编码导致日志过长
+    return record_detail
 
 
 async def read_ban_list(
-    websocket: Server.ServerConnection,
-) -> Tuple[List[BanUser], List[BanUser]]:
+    websocket: Server.ServerConnection, self_id: int
+) -> Tuple[List[BanUser], List[BanUser]] | None:
     """
     从根目录下的data文件夹中的文件读取禁言列表。
     同时自动更新已经失效禁言
+
+    只同步当前账号所在群中属于该账号或尚无归属的记录，其他账号的记录留给对应账号的连接处理；
+    属于该账号但已不在其群列表中的记录（账号已退出该群）会被删除。
+    按群分组并发与Napcat同步，同一群内的多条单人禁言记录通过一次获取群成员列表完成
     Returns:
         Tuple[
-            一个仍在禁言中的用户的BanUser列表,
-            一个已经自然解除禁言的用户的BanUser列表,
-            一个仍在全体禁言中的群的BanUser列表,
-            一个已经自然解除全体禁言的群的BanUser列表,
+            一个仍在禁言中的BanUser列表（含全体禁言的群）,
+            一个已经自然解除禁言的BanUser列表（含已解除全体禁言的群）,
         ]
+        同步失败时返回None，调用方应保留当前的禁言状态
     """
     try:
-        ban_list = db_manager.get_ban_records()
-        lifted_list: List[BanUser] = []
-        logger.info("已经读取禁言列表")
-        for ban_record in ban_list:
-            if ban_record.user_id == 0:
-                fetched_group_info = await get_group_info(websocket, ban_record.group_id)
-                if fetched_group_info is None:
-                    logger.warning(f"无法获取群信息，群号: {ban_record.group_id}，默认禁言解除")
-                    lifted_list.append(ban_record)
-                    ban_list.remove(ban_record)
-                    continue
-                group_all_shut: int = fetched_group_info.get("group_all_shut")
-                if group_all_shut == 0:
-                    lifted_list.append(ban_record)
-                    ban_list.remove(ban_record)
-                    continue
-            else:
-                fetched_member_info = await get_member_info(websocket, ban_record.group_id, ban_record.user_id)
-                if fetched_member_info is None:
-                    logger.warning(
-                        f"无法获取群成员信息，用户ID: {ban_record.user_id}, 群号: {ban_record.group_id}，默认禁言解除"
-                    )
-                    lifted_list.append(ban_record)
-                    ban_list.remove(ban_record)
-                    continue
-                lift_ban_time: int = fetched_member_info.get("shut_up_timestamp")
-                if lift_ban_time == 0:
-                    lifted_list.append(ban_record)
-                    ban_list.remove(ban_record)
-                else:
-                    ban_record.lift_time = lift_ban_time
-        db_manager.update_ban_record(ban_list)
+        group_list = await get_group_list(websocket)
+        if group_list is None:
+            logger.warning("无法获取群列表，跳过禁言列表同步")
+            return None
+        group_ids = {group.get("group_id") for group in group_list}
+        ban_records = await async_db_manager.get_ban_records()
+        records_by_group: Dict[int, List[BanUser]] = {}
+        for ban_record in ban_records:
+            if ban_record.group_id in group_ids and ban_record.self_id in (None, self_id):
+                ban_record.self_id = self_id
+                records_by_group.setdefault(ban_record.group_id, []).append(ban_record)
+        ban_records = [record for records in records_by_group.values() for record in records]
+        group_count = len(records_by_group)
+        logger.info(f"已经读取禁言列表，共 {len(ban_records)} 条记录，涉及 {group_count} 个群，开始同步")
+
+        start_time = time.monotonic()
+        semaphore = asyncio.Semaphore(global_config.napcat_server.ban_sync_concurrency)
+        finished_count = 0
+
+        async def reconcile(group_id: int, records: List[BanUser]) -> Tuple[List[BanUser], List[BanUser]]:
+            nonlocal finished_count
+            async with semaphore:
+                result = await _reconcile_group_ban_records(websocket, group_id, records)
+            finished_count += 1
+            if finished_count % 20 == 0 and finished_count < group_count:
+                logger.info(f"禁言列表同步进度: {finished_count}/{group_count} 个群")
+            return result
+
+        results = await asyncio.gather(*(reconcile(g, r) for g, r in records_by_group.items()))
+        ban_list: List[BanUser] = [record for banned, _ in results for record in banned]
+        lifted_list: List[BanUser] = [record for _, lifted in results for record in lifted]
+        await async_db_manager.update_ban_record(ban_list, group_ids, self_id)
+        logger.info(
+            f"禁言列表同步完成，用时 {time.monotonic() - start_time:.2f} 秒，"
+            f"仍在禁言 {len(ban_list)} 条，已解除 {len(lifted_list)} 条"
+        )
         return ban_list, lifted_list
     except Exception as e:
         logger.error(f"读取禁言列表失败: {e}")
-        return [], []
+        return None
+
+
+async def _reconcile_group_ban_records(
+    websocket: Server.ServerConnection, group_id: int, records: List[BanUser]
+) -> Tuple[List[BanUser], List[BanUser]]:
+    """
+    同步单个群的禁言记录
+    Returns:
+        Tuple[仍在禁言中的记录, 已经解除的记录]
+    """
+    ban_list: List[BanUser] = []
+    lifted_list: List[BanUser] = []
+    user_records: List[BanUser] = []
+    for ban_record in records:
+        if ban_record.user_id != 0:
+            user_records.append(ban_record)
+            continue
+        fetched_group_info = await get_group_info(websocket, group_id, no_cache=True)
+        if fetched_group_info is None:
+            logger.warning(f"无法获取群信息，群号: {group_id}，默认禁言解除")
+            lifted_list.append(ban_record)
+        elif fetched_group_info.get("group_all_shut") == 0:
+            lifted_list.append(ban_record)
+        else:
+            ban_list.append(ban_record)
+    if not user_records:
+        return ban_list, lifted_list
+
+    member_infos: Dict[int, dict | None] = {}
+    member_list = None
+    if len(user_records) > 1:
+        member_list = await get_group_member_list(websocket, group_id, no_cache=True)
+    if member_list is not None:
+        member_infos = {member.get("user_id"): member for member in member_list}
+    else:
+        fetched = await asyncio.gather(
+            *(get_member_info(websocket, group_id, record.user_id, no_cache=True) for record in user_records)
+        )
+        member_infos = {record.user_id: info for record, info in zip(user_records, fetched, strict=True)}
+
+    for ban_record in user_records:
+        fetched_member_info = member_infos.get(ban_record.user_id)
+        if fetched_member_info is None:
+            logger.warning(
+                f"无法获取群成员信息，用户ID: {ban_record.user_id}, 群号: {group_id}，默认禁言解除"
+            )
+            lifted_list.append(ban_record)
+            continue
+        lift_ban_time: int = fetched_member_info.get("shut_up_timestamp")
+        if lift_ban_time == 0:
+            lifted_list.append(ban_record)
+        else:
+            ban_record.lift_time = lift_ban_time
+            ban_list.append(ban_record)
+    return ban_list, lifted_list
 
 
-def save_ban_record(list: List[BanUser]):
-    return db_manager.update_ban_record(list)
+async def save_ban_record(list: List[BanUser]):
+    return await async_db_manager.update_ban_record(list)